@@ -0,0 +1,165 @@
+"""
+Load-test the chat endpoints end to end with the offline fake LLM provider,
+reporting latency percentiles and throughput at fixed concurrency levels.
+
+Each target server is started with uvicorn and LLM_PROVIDER=fake, so no API
+credit is spent; LLM_FAKE_* variables set in the environment pass through
+to shape the fake model (see llm.py). /api/chat (server.py) starts and
+answers without MongoDB, setting up its database in the background;
+/api/ai/chat (server_base.py) needs MongoDB at MONGO_URL and is skipped if
+it does not start in time. Pass --url to drive a server that is already
+running.
+
+    python benchmarks/bench_chat_load.py [--targets chat,ai-chat]
+        [--concurrency 1,8,32] [--requests 200] [--repeat] [--url URL]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import httpx
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+TARGETS = {
+    # /api/chat: sessions are per client address, so each virtual user
+    # sends its own X-Forwarded-For
+    "chat": {"app": "server:app", "path": "/api/chat", "health": "/healthz"},
+    "ai-chat": {"app": "server_base:app", "path": "/api/ai/chat", "health": "/api/health"},
+}
+
+QUESTION = "What should I think about when arranging the funeral?"
+
+FAKE_DEFAULTS = {
+    "LLM_FAKE_LATENCY": "lognormal:0.8,0.4",
+    "LLM_FAKE_TOKENS_PER_SECOND": "50",
+    "LLM_FAKE_REPLY_TOKENS": "120",
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, health, timeout=20.0):
+    """Run `app` under uvicorn with the fake provider; None if it fails to start"""
+    port = free_port()
+    env = {**FAKE_DEFAULTS, **os.environ, "LLM_PROVIDER": "fake"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            if httpx.get(base_url + health, timeout=1.0).status_code == 200:
+                return process, base_url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    process.wait()
+    return None, base_url
+
+
+def chat_body(target, run, user, n, repeat):
+    message = QUESTION if repeat else f"{QUESTION} (request {run}-{n})"
+    if target == "ai-chat":
+        return {"session_id": f"bench-{run}-{user}", "message": message}
+    return {"message": message, "context": {"answers": {"jurisdiction": "england-wales"}}}
+
+
+async def run_level(base_url, target, path, concurrency, total, repeat):
+    """Send `total` requests from `concurrency` users, each waiting for its
+    previous reply before the next"""
+    # Unique per level, so levels never answer from each other's cache
+    run = uuid.uuid4().hex[:8]
+    latencies, statuses = [], {}
+    next_request = iter(range(total))
+
+    async def user(client, u):
+        headers = {"X-Forwarded-For": f"10.{u // 65536 % 256}.{u // 256 % 256}.{u % 256}"}
+        for n in next_request:
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    path, json=chat_body(target, run, u, n, repeat), headers=headers
+                )
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "failed"
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client, u) for u in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def percentile(ordered, q):
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def report(concurrency, latencies, statuses, elapsed):
+    ms = sorted(t * 1000 for t in latencies)
+    ok = statuses.get(200, 0)
+    others = ", ".join(f"{s}: {c}" for s, c in statuses.items() if s != 200) or "-"
+    print(f"  c={concurrency:<4} {len(ms):5d} req   {ok / elapsed:7.1f} ok/s   "
+          f"p50 {percentile(ms, 0.50):8.1f} ms   p95 {percentile(ms, 0.95):8.1f} ms   "
+          f"p99 {percentile(ms, 0.99):8.1f} ms   other statuses {others}")
+
+
+def bench(target, base_url, levels, total, repeat):
+    path = TARGETS[target]["path"]
+    print(f"{target}: POST {base_url}{path}")
+    # Warm up imports, connections and the model's first call
+    asyncio.run(run_level(base_url, target, path, 1, 2, repeat))
+    for concurrency in levels:
+        report(concurrency, *asyncio.run(run_level(base_url, target, path, concurrency, total, repeat)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--targets", default="chat,ai-chat")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--repeat", action="store_true",
+                        help="ask the same question every time, so answers can come from the cache")
+    parser.add_argument("--url", help="drive this already running server (one target only)")
+    args = parser.parse_args()
+
+    targets = args.targets.split(",")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    fake = {k: os.environ.get(k, v) for k, v in FAKE_DEFAULTS.items()}
+    print("fake model: " + ", ".join(f"{k}={v}" for k, v in fake.items()))
+
+    for target in targets:
+        if args.url:
+            bench(target, args.url.rstrip("/"), levels, args.requests, args.repeat)
+            continue
+        process, base_url = start_server(TARGETS[target]["app"], TARGETS[target]["health"])
+        if process is None:
+            print(f"{target}: server did not start, skipped")
+            continue
+        try:
+            bench(target, base_url, levels, args.requests, args.repeat)
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark the per-request cost of building an LLM client against the shared
+pooled client, using a local fake OpenAI-compatible server over TLS (plain
+HTTP if openssl is unavailable).
+
+    python benchmarks/bench_llm_clients.py [requests]
+"""
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm import ModelConfig, OpenAIProvider
+
+MODEL = ModelConfig("openai", "fake-model")
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": MODEL.name,
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "Register the death within 5 days."},
+        "finish_reason": "stop"
+    }],
+    "usage": {"prompt_tokens": 20, "completion_tokens": 8, "total_tokens": 28}
+}).encode()
+
+
+async def fake_openai(scope, receive, send):
+    """Answers every chat completion instantly"""
+    if scope["type"] != "http":
+        return
+    while (await receive()).get("more_body"):
+        pass
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": COMPLETION})
+
+
+def self_signed_cert(directory):
+    if not shutil.which("openssl"):
+        return None, None
+    key, cert = os.path.join(directory, "key.pem"), os.path.join(directory, "cert.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=localhost", "-addext", "subjectAltName=IP:127.0.0.1",
+         "-keyout", key, "-out", cert],
+        check=True, capture_output=True
+    )
+    return key, cert
+
+
+def start_server(key, cert):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(
+        fake_openai, host="127.0.0.1", port=port, log_level="warning",
+        ssl_keyfile=key, ssl_certfile=cert
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    scheme = "https" if cert else "http"
+    return server, f"{scheme}://127.0.0.1:{port}/v1"
+
+
+async def per_request(base_url, n):
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        provider = OpenAIProvider("sk-bench", base_url=base_url)
+        await provider.complete(MODEL, "You are a guide.", [{"role": "user", "content": "hi"}], "s")
+        await provider.aclose()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def pooled(base_url, n):
+    provider = OpenAIProvider("sk-bench", base_url=base_url)
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await provider.complete(MODEL, "You are a guide.", [{"role": "user", "content": "hi"}], "s")
+        timings.append(time.perf_counter() - start)
+    await provider.aclose()
+    return timings
+
+
+def report(label, timings):
+    ms = [t * 1000 for t in timings]
+    print(f"  {label:<12} mean {statistics.mean(ms):7.2f} ms   "
+          f"p50 {statistics.median(ms):7.2f} ms   p95 {sorted(ms)[int(len(ms) * 0.95)]:7.2f} ms")
+    return statistics.mean(ms)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as directory:
+        key, cert = self_signed_cert(directory)
+        if cert:
+            os.environ["SSL_CERT_FILE"] = cert  # httpx trusts it via trust_env
+        server, base_url = start_server(key, cert)
+        try:
+            # Warm up imports and the server
+            asyncio.run(pooled(base_url, 5))
+            print(f"{n} sequential completions against {base_url}")
+            fresh = report("per request", asyncio.run(per_request(base_url, n)))
+            shared = report("pooled", asyncio.run(pooled(base_url, n)))
+            print(f"  overhead removed: {fresh - shared:.2f} ms per request ({fresh / shared:.1f}x)")
+        finally:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark nearest-supplier ranking: the per-document Haversine loop against
+the vectorized SupplierRanker.
+
+    python benchmarks/bench_supplier_ranking.py [sizes...]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from supplier_ranking import SupplierRanker, calculate_distance
+
+QUERY = (51.5014, -0.1419)  # Westminster
+RADIUS_MILES = 25.0
+LIMIT = 50
+
+
+def make_suppliers(n, seed=42):
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"supplier_{i}",
+            "type": "funeral_director",
+            "lat": rng.uniform(50.0, 57.0),
+            "lon": rng.uniform(-5.0, 2.0),
+            "available": True
+        }
+        for i in range(n)
+    ]
+
+
+def loop_nearest(suppliers, lat, lon):
+    matches = []
+    for supplier in suppliers:
+        distance = calculate_distance(lat, lon, supplier["lat"], supplier["lon"])
+        if distance <= RADIUS_MILES:
+            matches.append((supplier["id"], distance))
+    matches.sort(key=lambda m: m[1])
+    return matches[:LIMIT]
+
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes):
+    print(f"{'suppliers':>10} {'loop ms':>10} {'numpy ms':>10} {'speedup':>8}")
+    for n in sizes:
+        suppliers = make_suppliers(n)
+        ranker = SupplierRanker(suppliers)
+        repeat = 3 if n >= 1_000_000 else 10
+
+        loop_s, expected = best_of(lambda: loop_nearest(suppliers, *QUERY), repeat)
+        numpy_s, ranked = best_of(
+            lambda: ranker.nearest(*QUERY, limit=LIMIT, radius_miles=RADIUS_MILES), repeat * 5
+        )
+        assert [i for i, _ in ranked] == [i for i, _ in expected]
+
+        print(f"{n:>10,} {loop_s * 1000:>10.2f} {numpy_s * 1000:>10.2f} {loop_s / numpy_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(n) for n in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,207 @@
+"""
+Fan-out of live events (such as new condolences) to subscribers.
+
+A BroadcastHub delivers each event published on a topic to every
+subscriber of that topic in this process. Each subscriber has a bounded
+queue. A subscriber that falls behind is dropped rather than slowing
+delivery or growing its queue without limit; its stream ends so the client
+can reconnect and catch up from storage.
+
+Events published in one worker reach subscribers in others through a
+channel. With a channel every event is published to it, and each worker
+(including the publisher) delivers what it reads back. CappedCollectionChannel
+tails a MongoDB capped collection; a broker such as Redis pub/sub can stand
+in by providing the same publish() and listen().
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+_CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, hub: "BroadcastHub", topic: str, queue_size: int):
+        self.hub = hub
+        self.topic = topic
+        self.dropped = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def _offer(self, event: Any) -> bool:
+        """Queue an event; False if the subscriber is too far behind"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def _drop(self):
+        self.dropped = True
+        self._end()
+
+    def _end(self):
+        # Make room so the reader wakes up and stops
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(_CLOSED)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Any:
+        event = await self._queue.get()
+        if event is _CLOSED:
+            raise StopAsyncIteration
+        return event
+
+    def close(self):
+        self.hub._unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BroadcastHub:
+    def __init__(self, queue_size: int = 64, channel=None):
+        self.queue_size = queue_size
+        self.channel = channel
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, topic: str) -> Subscription:
+        """A subscription to `topic`; use as a context manager so it is closed"""
+        subscription = Subscription(self, topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    async def publish(self, topic: str, event: Any):
+        self.published += 1
+        if self.channel is not None:
+            await self.channel.publish(topic, event)
+        else:
+            self.deliver(topic, event)
+
+    def deliver(self, topic: str, event: Any):
+        """Hand an event to this process's subscribers of `topic`"""
+        for subscription in list(self._topics.get(topic, ())):
+            if subscription._offer(event):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+                subscription._drop()
+                self._unsubscribe(subscription)
+
+    async def start(self):
+        if self.channel is not None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        for subscribers in list(self._topics.values()):
+            for subscription in list(subscribers):
+                subscription._end()
+        self._topics.clear()
+
+    async def _listen(self):
+        # Set up here rather than in start(): the channel's backing store may
+        # not be reachable yet, and that must not hold up startup
+        await self.channel.setup()
+        async for topic, event in self.channel.listen():
+            self.deliver(topic, event)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self._topics),
+            "subscribers": sum(len(s) for s in self._topics.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "channel": type(self.channel).__name__ if self.channel is not None else None,
+        }
+
+
+class CappedCollectionChannel:
+    """
+    Cross-worker channel on a MongoDB capped collection: publishing inserts
+    a document and every worker follows the collection with a tailable
+    cursor. The cap bounds storage; old events are overwritten.
+    """
+
+    def __init__(self, db, name: str = "broadcast_events", size_bytes: int = 16 * 1024 * 1024,
+                 retry_seconds: float = 1.0):
+        self.db = db
+        self.name = name
+        self.size_bytes = size_bytes
+        self.retry_seconds = retry_seconds
+        self.collection = db[name]
+
+    async def setup(self):
+        try:
+            await self.db.create_collection(self.name, capped=True, size=self.size_bytes)
+        except CollectionInvalid:
+            pass  # Already exists
+        except Exception as e:
+            logger.warning(f"Could not create broadcast channel {self.name}: {str(e)}")
+
+    async def publish(self, topic: str, event: Any):
+        await self.collection.insert_one({"topic": topic, "event": event})
+
+    async def listen(self) -> AsyncIterator[Tuple[str, Any]]:
+        # Only events published from now on. The position is the last
+        # document read, found again by reading in $natural (insertion)
+        # order: ObjectIds made by different workers need not sort in the
+        # order their documents were inserted
+        last_id = None
+        while True:
+            try:
+                if last_id is None:
+                    latest = await self.collection.find({}, {"_id": 1}).sort("$natural", -1).to_list(1)
+                    # A tailable cursor on an empty collection dies at once,
+                    # so start from a marker document
+                    if not latest:
+                        await self.collection.insert_one({"topic": None})
+                        continue
+                    last_id = latest[0]["_id"]
+                # A tailable cursor cannot seek and always starts at the oldest
+                # document, so skip up to the last one read. If that has been
+                # overwritten, everything left is newer.
+                skipping = await self.collection.find_one({"_id": last_id}, {"_id": 1}) is not None
+                cursor = self.collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    async for doc in cursor:
+                        if skipping:
+                            skipping = doc["_id"] != last_id
+                            continue
+                        last_id = doc["_id"]
+                        if doc.get("topic") is not None:
+                            yield doc["topic"], doc.get("event")
+                    if skipping:
+                        # Caught up without passing it: overwritten meanwhile
+                        logger.warning(f"Broadcast channel {self.name} lost its position")
+                        skipping = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Broadcast channel {self.name} interrupted: {str(e)}")
+            await asyncio.sleep(self.retry_seconds)
@@ -0,0 +1,121 @@
+"""
+Cache of chat answers for repeated questions.
+
+Entries are keyed on the normalized question plus whatever shapes the
+prompt (model, jurisdiction, religion, ...). A per-process LRU with a TTL
+answers most repeats; an optional MongoDB collection shares answers
+between workers and expires them with a TTL index.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_RE = re.compile(r"[^a-z0-9£$%]+")
+
+
+def normalize_message(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(_NON_WORD_RE.sub(" ", message.lower()).split())
+
+
+def cache_key(model: str, message: str, **scope: Any) -> str:
+    """Stable key for a question asked of `model` within `scope`"""
+    payload = json.dumps(
+        {"model": model, "message": normalize_message(message), "scope": scope},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """In-process TTL/LRU cache with an optional shared MongoDB tier"""
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 6 * 3600, collection=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.collection = collection
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = {"memory": 0, "shared": 0}
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits["memory"] += 1
+                return value
+            # Expired entries stay until evicted, for stale()
+
+        if self.collection is not None:
+            try:
+                doc = await self.collection.find_one(
+                    {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+                )
+            except Exception as e:
+                logger.warning(f"Shared chat cache read failed: {str(e)}")
+                doc = None
+            if doc:
+                self._remember(key, doc["response"])
+                self.hits["shared"] += 1
+                return doc["response"]
+
+        self.misses += 1
+        return None
+
+    def stale(self, key: str) -> Optional[str]:
+        """The in-memory reply for a key even if it has expired, for when
+        the provider cannot answer"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.stale_hits += 1
+        return entry[0]
+
+    async def set(self, key: str, value: str):
+        self._remember(key, value)
+        if self.collection is not None:
+            try:
+                await self.collection.update_one(
+                    {"_id": key},
+                    {"$set": {
+                        "response": value,
+                        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+                    }},
+                    upsert=True
+                )
+            except Exception as e:
+                logger.warning(f"Shared chat cache write failed: {str(e)}")
+
+    def _remember(self, key: str, value: str):
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.hits["memory"] + self.hits["shared"]
+        lookups = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "shared": self.collection is not None,
+        }
@@ -0,0 +1,161 @@
+"""
+Bounded conversation history for chat prompts.
+
+Only the most recent turns that fit a token budget are sent to the model.
+Everything older is folded into a short rolling summary that is updated
+incrementally (only turns not yet summarized are read) and cached per
+session, so prompt size stays flat however long a conversation runs.
+"""
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Rough per-message overhead of chat formatting, in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap local token estimate: BPE tokenizers average about four
+    characters per token in English, but never fewer tokens than words
+    """
+    return max(len(text) // 4, len(_WORD_RE.findall(text)) * 3 // 4, 1)
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def trim_to_budget(
+    messages: Sequence[Dict[str, Any]],
+    token_budget: int
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split messages (oldest first) into (older, recent), where recent is
+    the longest suffix that fits the budget"""
+    used = 0
+    start = len(messages)
+    while start > 0:
+        cost = message_tokens(messages[start - 1])
+        if used + cost > token_budget:
+            break
+        used += cost
+        start -= 1
+    return list(messages[:start]), list(messages[start:])
+
+
+def _clip(text: str, limit: int = 160) -> str:
+    text = " ".join(text.split())
+    first = _SENTENCE_END_RE.split(text, maxsplit=1)[0]
+    return first if len(first) <= limit else first[:limit - 1].rstrip() + "…"
+
+
+def fold_summary(summary: str, messages: Sequence[Dict[str, Any]], token_budget: int) -> str:
+    """
+    Extend an extractive summary with more turns, keeping the most recent
+    lines that fit the budget
+    """
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        speaker = "User" if message["role"] == "user" else "Assistant"
+        lines.append(f"{speaker}: {_clip(message['content'])}")
+    kept: List[str] = []
+    used = 0
+    for line in reversed(lines):
+        used += estimate_tokens(line)
+        if used > token_budget:
+            break
+        kept.append(line)
+    return "\n".join(reversed(kept))
+
+
+def with_summary(system_message: str, summary: str) -> str:
+    if not summary:
+        return system_message
+    return f"{system_message}\n\nEARLIER IN THIS CONVERSATION:\n{summary}"
+
+
+class HistoryManager:
+    """Loads recent chat turns for a session and keeps its rolling summary"""
+
+    def __init__(
+        self,
+        messages,
+        summaries,
+        max_turns: int = 10,
+        token_budget: int = 1500,
+        summary_budget: int = 300,
+        cache_size: int = 1024
+    ):
+        self.messages = messages
+        self.summaries = summaries
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.cache_size = cache_size
+        self._summaries: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+    async def load(self, session_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        """(summary of older turns, recent messages oldest first)"""
+        # Newest first through the (session_id, timestamp) index
+        recent = await self.messages.find(
+            {"session_id": session_id},
+            {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", -1).limit(self.max_turns * 2).to_list(self.max_turns * 2)
+        recent.reverse()
+
+        older, kept = trim_to_budget(recent, self.token_budget)
+        if kept and (older or len(recent) == self.max_turns * 2):
+            # Summarize everything before the first message that is kept
+            summary = await self._summary(session_id, "$lt", kept[0]["timestamp"])
+        elif older:
+            summary = await self._summary(session_id, "$lte", older[-1]["timestamp"])
+        else:
+            summary = ""
+        return summary, [{"role": m["role"], "content": m["content"]} for m in kept]
+
+    async def _summary(self, session_id: str, op: str, bound: str) -> str:
+        """The session's summary, extended to cover every message whose
+        timestamp is `op` ("$lt" or "$lte") `bound`"""
+        cached = self._summaries.get(session_id)
+        if cached is None:
+            doc = await self.summaries.find_one({"session_id": session_id}, {"_id": 0})
+            cached = (doc["through"], doc["summary"]) if doc else ("", "")
+        through, summary = cached
+
+        if through < bound:
+            unsummarized = await self.messages.find(
+                {"session_id": session_id, "timestamp": {"$gt": through, op: bound}},
+                {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+            ).sort("timestamp", 1).to_list(None)
+            if unsummarized:
+                summary = fold_summary(summary, unsummarized, self.summary_budget)
+                through = unsummarized[-1]["timestamp"]
+                await self.summaries.update_one(
+                    {"session_id": session_id},
+                    {"$set": {"through": through, "summary": summary}},
+                    upsert=True
+                )
+
+        self._summaries[session_id] = (through, summary)
+        self._summaries.move_to_end(session_id)
+        while len(self._summaries) > self.cache_size:
+            self._summaries.popitem(last=False)
+        return summary
+
+
+def client_history(
+    history: Optional[Sequence[Any]],
+    token_budget: int = 1500,
+    summary_budget: int = 300
+) -> Tuple[str, List[Dict[str, str]]]:
+    """Budgeted (summary, recent messages) from history sent by the client"""
+    messages = [
+        {"role": m.role, "content": m.content}
+        for m in history or []
+        if m.role in ("user", "assistant") and m.content
+    ]
+    older, recent = trim_to_budget(messages, token_budget)
+    return fold_summary("", older, summary_budget) if older else "", recent
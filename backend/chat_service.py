@@ -0,0 +1,187 @@
+"""
+The path from a chat message to a model reply, shared by both servers.
+
+A ChatService puts the answer cache and request coalescing in front of the
+configured LLM provider: cached answers are returned straight away, and
+concurrent identical questions share a single upstream call. Follow-ups
+that depend on earlier turns are passed without a key and always go
+upstream. Every upstream call is admitted through a FairScheduler, which
+raises Overloaded when the service is saturated (a shared call is
+admitted under its first caller's session; if that is turned away, the
+callers that joined it try again under their own), and made through an
+LLMGuard, which raises LLMUnavailable when the provider times out or is
+failing; a keyed question is then answered from a stale cache entry if
+there is one.
+"""
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+from chat_cache import ResponseCache
+from llm import ModelConfig, get_provider
+from llm_resilience import LLMGuard, LLMUnavailable
+from llm_scheduler import FairScheduler, Overloaded
+from metrics import CHAT_STAGE_SECONDS, LLM_GUARD_EVENTS
+from singleflight import SingleFlight
+
+
+class LLMNotConfigured(Exception):
+    pass
+
+
+class ChatService:
+    def __init__(
+        self,
+        model: ModelConfig,
+        cache: ResponseCache,
+        scheduler: Optional[FairScheduler] = None,
+        guard: Optional[LLMGuard] = None
+    ):
+        self.model = model
+        self.cache = cache
+        self.scheduler = scheduler or FairScheduler()
+        self.guard = guard or LLMGuard(model.name, deadline_seconds=model.timeout)
+        self.flight = SingleFlight()
+
+    @property
+    def configured(self) -> bool:
+        return get_provider() is not None
+
+    def _provider(self):
+        provider = get_provider()
+        if provider is None:
+            raise LLMNotConfigured("AI service not configured")
+        return provider
+
+    async def complete(
+        self,
+        key: Optional[str],
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> str:
+        """The reply to `messages`, from cache, a call already in flight for
+        the same key, or a new upstream call. A None key skips both.
+        Upstream slots are shared fairly between sessions."""
+        if key is None:
+            return await self._fetch(key, system_message, messages, session_id)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        led = False
+
+        def fetch():
+            nonlocal led
+            led = True
+            return self._fetch(key, system_message, messages, session_id)
+
+        while True:
+            try:
+                return await self.flight.do(key, fetch)
+            except Overloaded:
+                if led:
+                    raise
+                # The call joined was turned away under its leader's session;
+                # ask again under this caller's own
+            except LLMUnavailable as e:
+                return self._stale(key, e)
+
+    async def _fetch(self, key, system_message, messages, session_id) -> str:
+        provider = self._provider()
+        self.guard.breaker.check()
+        queued = time.perf_counter()
+        async with self.scheduler.slot(session_id):
+            started = self._observe("queue", queued)
+            async with self.guard.call():
+                reply = await self.guard.complete(
+                    provider, self.model, system_message, messages, session_id, slots=self.scheduler
+                )
+            self._observe("upstream", started)
+        if key is not None:
+            await self.cache.set(key, reply)
+        return reply
+
+    def _stale(self, key: str, error: LLMUnavailable) -> str:
+        """An expired cached reply while the provider is unavailable, or
+        the error"""
+        reply = self.cache.stale(key)
+        if reply is None:
+            raise error
+        LLM_GUARD_EVENTS.inc(model=self.model.name, event="stale_answer")
+        return reply
+
+    async def stream(
+        self,
+        key: Optional[str],
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> AsyncIterator[str]:
+        """The reply to `messages` in pieces. Cached replies and replies
+        already being fetched with complete() arrive as one piece; concurrent
+        streams for the same key share one upstream stream."""
+        if key is None:
+            async for delta in self._fetch_stream(key, system_message, messages, session_id):
+                yield delta
+            return
+
+        cached = await self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        led = sent = False
+
+        def fetch():
+            nonlocal led
+            led = True
+            return self._fetch_stream(key, system_message, messages, session_id)
+
+        while True:
+            try:
+                async for delta in self.flight.stream(key, fetch):
+                    sent = True
+                    yield delta
+                return
+            except Overloaded:
+                if led or sent:
+                    raise
+                # As in complete(): retry under this caller's session
+            except LLMUnavailable as e:
+                if sent:
+                    raise
+                yield self._stale(key, e)
+                return
+
+    async def _fetch_stream(self, key, system_message, messages, session_id) -> AsyncIterator[str]:
+        provider = self._provider()
+        chunks = []
+        self.guard.breaker.check()
+        queued = time.perf_counter()
+        async with self.scheduler.slot(session_id):
+            started = self._observe("queue", queued)
+            async with self.guard.call():
+                async for delta in self.guard.stream(
+                    provider, self.model, system_message, messages, session_id
+                ):
+                    if not chunks:
+                        self._observe("first_token", started)
+                    chunks.append(delta)
+                    yield delta
+            self._observe("upstream", started)
+        if key is not None:
+            await self.cache.set(key, "".join(chunks))
+
+    def _observe(self, stage: str, since: float) -> float:
+        """Record the time since `since` for a stage; returns now"""
+        now = time.perf_counter()
+        CHAT_STAGE_SECONDS.observe(now - since, model=self.model.name, stage=stage)
+        return now
+
+    def stats(self):
+        return {
+            "cache": self.cache.stats(),
+            "coalescing": self.flight.stats(),
+            "admission": self.scheduler.stats(),
+            "upstream": self.guard.stats(),
+        }
@@ -5,14 +5,16 @@ from datetime import datetime
 from dotenv import load_dotenv
 from pathlib import Path
 
+from suppliers import PRICE_SUMMARY_STAGE
+
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # Database configuration
-mongo_url = os.environ.get('MONGO_URL')
+mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME')]
+db = client[os.environ.get('DB_NAME', 'afterlife_db')]
 
 # Collections
 user_sessions = db.user_sessions
@@ -20,6 +22,12 @@ assessment_responses = db.assessment_responses
 step_progress = db.step_progress
 support_resources = db.support_resources
 guidance_data = db.guidance_data
+suppliers = db.suppliers
+chat_response_cache = db.chat_response_cache
+chat_messages = db.chat_messages
+chat_summaries = db.chat_summaries
+memorials = db.memorials
+condolences = db.condolences
 
 async def create_indexes():
     """Create database indexes for better performance"""
@@ -47,10 +55,67 @@ async def create_indexes():
         await guidance_data.create_index("location")
         await guidance_data.create_index("budget")
         
+        # Supplier indexes
+        await suppliers.create_index("id")
+        await suppliers.create_index("postcode")
+        await suppliers.create_index([("location", "2dsphere")])
+        # Price and rating sorts, with and without a type filter
+        await suppliers.create_index([("type", 1), ("available", 1), ("avg_price", 1), ("id", 1)])
+        await suppliers.create_index([("type", 1), ("available", 1), ("rating", -1), ("id", 1)])
+        await suppliers.create_index([("available", 1), ("avg_price", 1), ("id", 1)])
+        await suppliers.create_index([("available", 1), ("rating", -1), ("id", 1)])
+        await suppliers.create_index(
+            [("name", "text"), ("services", "text"), ("description", "text")],
+            weights={"name": 10, "services": 5, "description": 1},
+            name="supplier_text"
+        )
+        
+        # Chat history: per-session pages in (timestamp, id) order
+        await chat_messages.create_index([("session_id", 1), ("timestamp", 1), ("id", 1)])
+        await chat_messages.create_index("id")
+        await chat_summaries.create_index("session_id", unique=True)
+        
+        # Memorials: lookups by id, newest-first listings per user and of
+        # public memorials, with id breaking created_at ties for cursors
+        await memorials.create_index("id", unique=True)
+        await memorials.create_index(
+            "slug", unique=True, partialFilterExpression={"slug": {"$type": "string"}}
+        )
+        await memorials.create_index([("user_id", 1), ("created_at", -1), ("id", -1)])
+        await memorials.create_index([("is_public", 1), ("created_at", -1), ("id", -1)])
+        await condolences.create_index([("memorial_id", 1), ("timestamp", -1), ("id", -1)])
+        await condolences.create_index("id", unique=True)
+        
+        # Shared chat answer cache: expire entries at their expires_at
+        await chat_response_cache.create_index("expires_at", expireAfterSeconds=0)
+        
         print("Database indexes created successfully")
     except Exception as e:
         print(f"Error creating indexes: {e}")
 
+async def backfill_supplier_fields():
+    """Add derived location and price summary fields to older suppliers"""
+    try:
+        result = await suppliers.update_many(
+            {
+                "location": {"$exists": False},
+                "lat": {"$type": "number"},
+                "lon": {"$type": "number"}
+            },
+            [{"$set": {"location": {"type": "Point", "coordinates": ["$lon", "$lat"]}}}]
+        )
+        if result.modified_count:
+            print(f"Backfilled location for {result.modified_count} suppliers")
+        
+        result = await suppliers.update_many(
+            {"avg_price": {"$exists": False}},
+            [PRICE_SUMMARY_STAGE]
+        )
+        if result.modified_count:
+            print(f"Backfilled price summary for {result.modified_count} suppliers")
+    except Exception as e:
+        print(f"Error backfilling supplier fields: {e}")
+
 async def init_guidance_data():
     """Initialize the database with guidance data"""
     try:
@@ -0,0 +1,240 @@
+"""
+Jurisdiction guidance tables, and direct answers to the simple factual
+questions they cover.
+
+quick_answer() recognises questions such as "how long do I have to register
+a death in Scotland?" or "what's the DWP bereavement number?" and answers
+them from these tables without a model call. Anything open-ended, or
+anything the tables cannot answer for the jurisdiction asked about,
+returns None and goes to the LLM.
+"""
+from typing import Any, Dict, List, Optional
+
+from intents import KeywordMatcher
+
+JURISDICTION_GUIDANCE: Dict[str, Dict[str, Any]] = {
+    "england-wales": {
+        "registration_deadline": "5 days",
+        "probate_term": "Probate",
+        "probate_threshold": "£5,000",
+        "probate_link": "https://www.gov.uk/applying-for-probate",
+        "tell_us_once": True,
+        "registrar_link": "https://www.gov.uk/register-a-death",
+        "key_steps": [
+            "Get the medical certificate from the doctor",
+            "Register the death within 5 days",
+            "Use Tell Us Once to notify government departments",
+            "Apply for probate if needed"
+        ]
+    },
+    "scotland": {
+        "registration_deadline": "8 days",
+        "probate_term": "Confirmation",
+        "probate_threshold": "£36,000",
+        "probate_link": "https://www.mygov.scot/applying-for-confirmation",
+        "tell_us_once": True,
+        "registrar_link": "https://www.nrscotland.gov.uk/registration/registering-a-death",
+        "key_steps": [
+            "Get the medical certificate from the doctor",
+            "Register the death within 8 days",
+            "Use Tell Us Once to notify government departments",
+            "Apply for Confirmation if needed"
+        ]
+    },
+    "northern-ireland": {
+        "registration_deadline": "5 days",
+        "probate_term": "Probate",
+        "probate_threshold": None,
+        "probate_link": None,
+        "tell_us_once": False,
+        "registrar_link": "https://www.nidirect.gov.uk/articles/registering-death",
+        "key_steps": [
+            "Get the medical certificate from the doctor",
+            "Register the death within 5 days",
+            "Notify government departments individually (Tell Us Once not available)",
+            "Apply for probate if needed"
+        ]
+    }
+}
+
+JURISDICTION_NAMES = {
+    "england-wales": "England and Wales",
+    "scotland": "Scotland",
+    "northern-ireland": "Northern Ireland",
+}
+
+CONTACTS = {
+    "dwp": ("DWP Bereavement Service", "0800 731 0469"),
+    "hmrc": ("HMRC bereavement helpline", "0300 200 3300"),
+}
+
+TELL_US_ONCE_LINK = "https://www.gov.uk/after-a-death/organisations-you-need-to-contact-and-tell-us-once"
+
+
+def get_jurisdiction_guidance(jurisdiction: str) -> Dict[str, Any]:
+    return JURISDICTION_GUIDANCE.get(jurisdiction, JURISDICTION_GUIDANCE["england-wales"])
+
+
+def core_facts() -> str:
+    """One line per fact in the tables, for system prompts"""
+    by_jurisdiction = JURISDICTION_GUIDANCE.items()
+    lines = [
+        "- Death registration: " + ", ".join(
+            f"{g['registration_deadline']} ({JURISDICTION_NAMES[j]})" for j, g in by_jurisdiction
+        ),
+        "- Tell Us Once: " + ", ".join(
+            f"{'available' if g['tell_us_once'] else 'NOT available'} in {JURISDICTION_NAMES[j]}"
+            for j, g in by_jurisdiction
+        ),
+        "- Probate threshold: " + ", ".join(
+            f"{g['probate_threshold']} in {JURISDICTION_NAMES[j]} (\"{g['probate_term']}\")"
+            for j, g in by_jurisdiction if g["probate_threshold"]
+        ),
+    ]
+    lines += [f"- {name}: {number}" for name, number in CONTACTS.values()]
+    return "\n".join(lines)
+
+
+# Message vocabulary; a factual intent needs a topic and an aspect that
+# asks about it
+_MATCHER = KeywordMatcher({
+    "registration": ["regist"],
+    # Naming the deadline counts wherever it comes
+    "deadline": ["deadline", "time limit"],
+    # Asking how soon only counts before the registration it is about: "how
+    # long do I have to register", not "registered with a GP, how long until"
+    "how_soon": ["how long", "how many days", "how soon", "by when", "when do i have to", "when must"],
+    "tell_us_once": ["tell us once", "tell-us-once"],
+    "availability": ["available", "availability", "can i use", "can we use", "can you use",
+                     "is there", "offered"],
+    # Bare "confirmation" is as likely to be a letter from the bank
+    "probate": ["probate", "grant of confirmation", "confirmation of executors"],
+    "threshold": ["threshold", "how much", "minimum", "worth", "small estate"],
+    "dwp": ["dwp", "department for work and pensions"],
+    "hmrc": ["hmrc"],
+    "contact": ["phone number", "number", "helpline", "telephone", "contact details",
+                "how do i contact", "how can i contact", "how do i call", "how can i call"],
+    "england-wales": ["england", "english", "wales", "welsh"],
+    "scotland": ["scotland", "scottish"],
+    "northern-ireland": ["northern ireland"],
+    # Signs a question wants discussion rather than a fact
+    "open": ["why", "explain", "should i", "what if", "what happens", "what now", "what next",
+             "advice", "advise", "difference", "compare", "contest", "dispute", "complicated",
+             "problem"],
+})
+
+# Opening words of a question asked without a question mark
+_QUESTION_WORDS = {"how", "what", "what's", "whats", "when", "where", "which", "who",
+                   "is", "are", "do", "does", "can", "could"}
+
+# Longer messages are rarely a single factual question
+MAX_QUICK_ANSWER_WORDS = 25
+
+
+def _registration_deadline(jurisdictions: List[str]) -> str:
+    if len(jurisdictions) == 1:
+        guidance = JURISDICTION_GUIDANCE[jurisdictions[0]]
+        return (
+            f"In {JURISDICTION_NAMES[jurisdictions[0]]}, a death must be registered within "
+            f"{guidance['registration_deadline']}. You can find your local register office here: "
+            f"{guidance['registrar_link']}"
+        )
+    return "A death must be registered within:\n" + "\n".join(
+        f"- {JURISDICTION_NAMES[j]}: {JURISDICTION_GUIDANCE[j]['registration_deadline']} "
+        f"({JURISDICTION_GUIDANCE[j]['registrar_link']})"
+        for j in jurisdictions
+    )
+
+
+def _tell_us_once(jurisdictions: List[str]) -> str:
+    lines = []
+    for j in jurisdictions:
+        if JURISDICTION_GUIDANCE[j]["tell_us_once"]:
+            lines.append(
+                f"Tell Us Once is available in {JURISDICTION_NAMES[j]}: the registrar gives you a "
+                f"reference number so you can notify most government departments in one go."
+            )
+        else:
+            lines.append(
+                f"Tell Us Once is not available in {JURISDICTION_NAMES[j]}, so government "
+                f"departments need to be notified individually."
+            )
+    return " ".join(lines) + f" More information: {TELL_US_ONCE_LINK}"
+
+
+def _probate_threshold(jurisdictions: List[str]) -> Optional[str]:
+    lines = []
+    for j in jurisdictions:
+        guidance = JURISDICTION_GUIDANCE[j]
+        if not guidance["probate_threshold"]:
+            return None
+        term = "probate" if guidance["probate_term"] == "Probate" else f"{guidance['probate_term']} (probate)"
+        lines.append(
+            f"In {JURISDICTION_NAMES[j]}, {term} is usually needed if the estate is worth more "
+            f"than {guidance['probate_threshold']}; banks and other organisations may set their "
+            f"own limits. Apply here: {guidance['probate_link']}"
+        )
+    return "\n".join(lines)
+
+
+def _contact(organisation: str) -> str:
+    name, number = CONTACTS[organisation]
+    return f"You can call the {name} on {number}."
+
+
+def quick_answer(message: str, jurisdiction: Optional[str] = None) -> Optional[str]:
+    """
+    A direct answer for a simple factual question, or None when the message
+    needs the LLM. Jurisdictions named in the message take precedence over
+    `jurisdiction`; with neither, answers cover every jurisdiction.
+    """
+    if len(message.split()) > MAX_QUICK_ANSWER_WORDS or message.count("?") > 1:
+        return None
+    words = message.lower().split()
+    if "?" not in message and (not words or words[0] not in _QUESTION_WORDS):
+        return None  # A statement, not a question
+    positions = _MATCHER.positions(message)
+    tags = set(positions)
+    if "open" in tags:
+        return None
+
+    intents = []
+    if "registration" in tags and (
+        "deadline" in tags or positions.get("how_soon", len(message)) < positions["registration"]
+    ):
+        intents.append("registration_deadline")
+    if "tell_us_once" in tags and "availability" in tags:
+        intents.append("tell_us_once")
+    if "probate" in tags and "threshold" in tags:
+        intents.append("probate_threshold")
+    for organisation in CONTACTS:
+        if organisation in tags and "contact" in tags:
+            intents.append(organisation)
+    if len(intents) != 1:
+        return None
+
+    jurisdictions = [j for j in JURISDICTION_GUIDANCE if j in tags]
+    if not jurisdictions:
+        jurisdictions = [jurisdiction] if jurisdiction in JURISDICTION_GUIDANCE else list(JURISDICTION_GUIDANCE)
+
+    intent = intents[0]
+    if intent == "registration_deadline":
+        return _registration_deadline(jurisdictions)
+    if intent == "tell_us_once":
+        return _tell_us_once(jurisdictions)
+    if intent == "probate_threshold":
+        return _probate_threshold(jurisdictions)
+    return _contact(intent)
+
+
+def fallback_answer(context: str = "") -> str:
+    """
+    What to say when the AI assistant cannot answer: `context` (guidance
+    passages relevant to the question) if there is any, else the core facts
+    """
+    return (
+        "I'm sorry, the AfterLife assistant can't answer right now. In the meantime, "
+        "this guidance may help:\n"
+        f"{context or core_facts()}\n"
+        "Please try your question again in a few minutes."
+    )
@@ -0,0 +1,38 @@
+"""
+Keyword intent detection for chat messages.
+"""
+import re
+from typing import Dict, Sequence, Set
+
+
+class KeywordMatcher:
+    """
+    Finds which tags' keywords occur in a text. All keywords are compiled
+    into one regular expression, so a message is scanned once whatever the
+    number of keywords. Keywords match at the start of a word ("florist"
+    also matches "florists") and spaces in a keyword match any whitespace.
+    Keywords should not overlap between tags: matches do not overlap.
+    """
+
+    def __init__(self, tags: Dict[str, Sequence[str]]):
+        self._tags = list(tags)
+        groups = []
+        for i, keywords in enumerate(tags.values()):
+            # Longest first, so "tell us once" wins over a shorter prefix
+            alternatives = sorted(keywords, key=len, reverse=True)
+            pattern = "|".join(re.escape(k).replace(r"\ ", r"\s+") for k in alternatives)
+            groups.append(f"(?P<t{i}>{pattern})")
+        self._pattern = re.compile(r"\b(?:" + "|".join(groups) + ")", re.IGNORECASE)
+
+    def tags(self, text: str) -> Set[str]:
+        return set(self.positions(text))
+
+    def positions(self, text: str) -> Dict[str, int]:
+        """Offset of each tag's first match in the text"""
+        positions: Dict[str, int] = {}
+        for m in self._pattern.finditer(text):
+            positions.setdefault(self._tags[int(m.lastgroup[1:])], m.start())
+        return positions
+
+    def matches(self, text: str) -> bool:
+        return self._pattern.search(text) is not None
@@ -0,0 +1,198 @@
+"""
+Retrieval over AfterLife's own guidance content for chat prompts.
+
+Guidance documents (guidance_data) and support resources are split into
+short passages and held in an in-process BM25 index. For each chat
+message only the few passages that best match it are added to the
+system prompt, instead of sending a long static block every time. The
+index is built at startup and rebuilt when the collections change:
+through a change stream where MongoDB supports one (replica sets),
+otherwise by polling.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+from text_index import TOKEN_RE, InvertedIndex
+
+logger = logging.getLogger(__name__)
+
+PASSAGE_FIELDS = {"title": 2.0, "text": 1.0}
+
+# Words too common in questions to say anything about which passage fits
+STOPWORDS = frozenset("""
+a about after all am an and any are as at be been but by can could did do does
+for from get got had has have he her his how i if in into is it its just me my
+need of on or our she should so that the their them then there they this to
+us was we were what when where which who why will with would you your
+""".split())
+
+
+def _lines(value: Any) -> List[str]:
+    """Readable lines from a nested guidance value"""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (int, float)):
+        return [str(value)]
+    if isinstance(value, list):
+        return [line for item in value for line in _lines(item)]
+    if isinstance(value, dict):
+        if "item" in value and "range" in value:
+            return [f"{value['item']}: {value['range']}"]
+        return [line for item in value.values() for line in _lines(item)]
+    return []
+
+
+def guidance_passages(doc: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Passages from one guidance_data document"""
+    category = doc.get("category", "").replace("_", " ")
+    scope = doc.get("location") or doc.get("religion") or doc.get("budget")
+    heading = f"{category} ({scope.replace('_', ' ')})" if scope else category
+    data = doc.get("data") or {}
+
+    if "title" in data:
+        body = [data.get("description", "")]
+        for key, value in data.items():
+            if key not in ("title", "description"):
+                body.extend(_lines(value))
+        return [{"title": f"{heading}: {data['title']}", "text": "; ".join(b for b in body if b)}]
+
+    # Task lists keyed by priority: one passage per task
+    passages = []
+    for priority, tasks in data.items():
+        for task in tasks if isinstance(tasks, list) else []:
+            details = [task.get("description", ""), task.get("notes", "")]
+            if task.get("contact"):
+                details.append(f"Contact: {task['contact']}")
+            passages.append({
+                "title": f"{heading}, {priority}: {task.get('title', '')}",
+                "text": " ".join(d for d in details if d),
+            })
+    return passages
+
+
+def resource_passage(doc: Dict[str, Any]) -> Dict[str, str]:
+    """Passage for one support resource"""
+    details = [doc.get("description", "")]
+    offers = doc.get("specialties") or doc.get("services")
+    if offers:
+        details.append("Offers: " + ", ".join(offers) + ".")
+    if doc.get("contact"):
+        details.append(f"Contact: {doc['contact']}.")
+    if doc.get("availability"):
+        details.append(f"Open: {doc['availability']}.")
+    kind = doc.get("type")
+    return {
+        "title": f"Support resource: {doc.get('name', '')}" + (f" ({kind})" if kind else ""),
+        "text": " ".join(d for d in details if d),
+    }
+
+
+def query_text(message: str) -> str:
+    """The words of a message worth searching for"""
+    return " ".join(
+        word for word in TOKEN_RE.findall(message.lower())
+        if len(word) > 2 and word not in STOPWORDS
+    )
+
+
+def with_context(system_message: str, context: str) -> str:
+    if not context:
+        return system_message
+    return f"{system_message}\n\nRELEVANT AFTERLIFE GUIDANCE:\n{context}"
+
+
+class KnowledgeBase:
+    def __init__(
+        self,
+        guidance,
+        resources,
+        top_k: int = 3,
+        min_score: float = 1.0,
+        min_relative_score: float = 0.5
+    ):
+        self.guidance = guidance
+        self.resources = resources
+        self.top_k = top_k
+        # Passages must score at least min_score and, so weak matches do not
+        # ride along with a strong one, min_relative_score of the best
+        self.min_score = min_score
+        self.min_relative_score = min_relative_score
+        self._index = InvertedIndex(PASSAGE_FIELDS)
+        self._passages: List[Dict[str, str]] = []
+        self._fingerprint: Optional[str] = None
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> str:
+        """Changes whenever the indexed content does"""
+        return self._fingerprint or ""
+
+    def __len__(self):
+        return len(self._passages)
+
+    async def refresh(self) -> bool:
+        """Reload both collections; rebuild the index if anything changed"""
+        guidance = await self.guidance.find({}, {"_id": 0}).to_list(None)
+        resources = await self.resources.find({}, {"_id": 0}).to_list(None)
+        fingerprint = hashlib.sha256(
+            json.dumps([guidance, resources], sort_keys=True, default=str).encode()
+        ).hexdigest()[:16]
+        if fingerprint == self._fingerprint:
+            return False
+
+        passages = [p for doc in guidance for p in guidance_passages(doc)]
+        passages += [resource_passage(doc) for doc in resources]
+        index = InvertedIndex(PASSAGE_FIELDS)
+        for i, passage in enumerate(passages):
+            index.add(i, passage)
+        self._index, self._passages, self._fingerprint = index, passages, fingerprint
+        logger.info(f"Knowledge index built: {len(passages)} passages")
+        return True
+
+    def retrieve(self, message: str, k: Optional[int] = None) -> List[Dict[str, str]]:
+        """The passages most relevant to a message, best first"""
+        query = query_text(message)
+        if not query:
+            return []
+        results = self._index.search(query, limit=k or self.top_k, match_all=False)
+        if not results:
+            return []
+        cutoff = max(self.min_score, results[0][1] * self.min_relative_score)
+        return [self._passages[i] for i, score in results if score >= cutoff]
+
+    def context(self, message: str) -> str:
+        """Relevant passages formatted for a system prompt ("" if none)"""
+        return "\n".join(f"- {p['title']}: {p['text']}" for p in self.retrieve(message))
+
+    def start(self, poll_seconds: float = 300):
+        """Keep the index current in the background"""
+        self._watcher = asyncio.create_task(self._watch(poll_seconds))
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+    async def _watch(self, poll_seconds: float):
+        names = [self.guidance.name, self.resources.name]
+        try:
+            async with self.guidance.database.watch([{"$match": {"ns.coll": {"$in": names}}}]) as changes:
+                async for _ in changes:
+                    await self.refresh()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Change streams need a replica set; poll a standalone server
+            logger.info(f"Knowledge index falling back to polling: {str(e)}")
+        while True:
+            await asyncio.sleep(poll_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Knowledge index refresh failed: {str(e)}")
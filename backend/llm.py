@@ -0,0 +1,316 @@
+"""
+LLM providers behind the chat endpoints.
+
+Both servers talk to the model through a provider with the same two calls:
+`complete` returns the whole reply and `stream` yields it in pieces as the
+upstream API produces them. The provider is chosen with LLM_PROVIDER:
+
+- "emergent" (default): emergentintegrations LlmChat with EMERGENT_LLM_KEY.
+  LlmChat only returns whole completions, so streaming yields one chunk,
+  and it takes a single user message, so earlier turns are folded into
+  the system message.
+- "openai": the OpenAI API (or a compatible OPENAI_BASE_URL) with
+  OPENAI_API_KEY, streamed token by token.
+- "fake": an offline stand-in with configurable latency, token rate and
+  error rate (LLM_FAKE_*), for load tests that must not spend API credit.
+
+Providers live in a process-wide LLMClientPool that the servers start up
+and close down, so requests share one client and its keep-alive
+connections instead of building a new client per request.
+"""
+import asyncio
+import os
+import random
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional
+
+from chat_history import estimate_tokens
+from metrics import record_tokens
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    provider: str  # provider family passed to LlmChat.with_model, e.g. "openai"
+    name: str
+    # Per-model request options (the emergent provider only uses timeout
+    # through its own defaults)
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    timeout: float = 60.0
+
+
+class EmergentProvider:
+    name = "emergent"
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+
+    async def complete(
+        self,
+        model: ModelConfig,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> str:
+        if len(messages) > 1:
+            turns = "\n".join(
+                f"{'User' if m['role'] == 'user' else 'Assistant'}: {m['content']}"
+                for m in messages[:-1]
+            )
+            system_message = f"{system_message}\n\nCONVERSATION SO FAR:\n{turns}"
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+        # LlmChat keeps per-conversation state, so it is not shared between
+        # requests; only the provider (and its key) is
+        chat = LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(model.provider, model.name)
+        reply = await chat.send_message(UserMessage(text=messages[-1]["content"]))
+        # LlmChat does not report usage
+        record_tokens(
+            model.name,
+            estimate_tokens(system_message) + estimate_tokens(messages[-1]["content"]),
+            estimate_tokens(reply),
+            source="estimate"
+        )
+        return reply
+
+    async def stream(
+        self,
+        model: ModelConfig,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> AsyncIterator[str]:
+        yield await self.complete(model, system_message, messages, session_id)
+
+    async def aclose(self):
+        pass
+
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, max_connections: int = 20):
+        import httpx
+        from openai import AsyncOpenAI
+
+        # One connection pool for every request; idle connections are kept
+        # alive so most calls skip the TCP and TLS handshakes
+        self._client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections,
+                    keepalive_expiry=60.0
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+        )
+
+    @staticmethod
+    def _messages(system_message: str, messages: List[Dict[str, str]]):
+        return [{"role": "system", "content": system_message}, *messages]
+
+    @staticmethod
+    def _options(model: ModelConfig) -> Dict[str, object]:
+        options: Dict[str, object] = {"timeout": model.timeout}
+        if model.max_tokens is not None:
+            options["max_tokens"] = model.max_tokens
+        if model.temperature is not None:
+            options["temperature"] = model.temperature
+        return options
+
+    async def aclose(self):
+        await self._client.close()
+
+    async def complete(
+        self,
+        model: ModelConfig,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> str:
+        response = await self._client.chat.completions.create(
+            model=model.name,
+            messages=self._messages(system_message, messages),
+            user=session_id,
+            **self._options(model)
+        )
+        if response.usage:
+            record_tokens(model.name, response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content or ""
+
+    async def stream(
+        self,
+        model: ModelConfig,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> AsyncIterator[str]:
+        response = await self._client.chat.completions.create(
+            model=model.name,
+            messages=self._messages(system_message, messages),
+            user=session_id,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._options(model)
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                record_tokens(model.name, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+
+
+class FakeLLMError(Exception):
+    pass
+
+
+def parse_latency(spec: str):
+    """
+    A sampler for a latency spec, in seconds: "fixed:0.5", "uniform:0.2,1.5"
+    or "lognormal:0.8,0.5" (median and sigma)
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rng: median * rng.lognormvariate(0.0, sigma)
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+FAKE_REPLY = (
+    "I'm sorry for your loss. The first steps are to get the medical certificate "
+    "from the doctor and register the death with your local register office. "
+    "Once it is registered you can use Tell Us Once to let government departments "
+    "know, and then start thinking about the funeral and the estate. "
+)
+
+
+class FakeProvider:
+    """
+    Answers without a network call, to load-test the chat path offline.
+    Each reply waits a sampled time to first token (queueing and prompt
+    processing upstream), then produces reply_tokens words at
+    tokens_per_second; error_rate of calls fail before the first token.
+    """
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: str = "lognormal:0.8,0.4",
+        tokens_per_second: float = 50.0,
+        reply_tokens: int = 120,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self._latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        words = FAKE_REPLY.split()
+        self._words = [words[i % len(words)] for i in range(reply_tokens)]
+
+    async def _first_token(self):
+        await asyncio.sleep(self._latency(self._rng))
+        if self._rng.random() < self.error_rate:
+            raise FakeLLMError("Fake upstream error")
+
+    def _record(self, model: ModelConfig, system_message: str, messages: List[Dict[str, str]]):
+        prompt = estimate_tokens(system_message) + sum(estimate_tokens(m["content"]) for m in messages)
+        record_tokens(model.name, prompt, len(self._words), source="fake")
+
+    async def complete(
+        self,
+        model: ModelConfig,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> str:
+        await self._first_token()
+        await asyncio.sleep(len(self._words) / self.tokens_per_second)
+        self._record(model, system_message, messages)
+        return " ".join(self._words)
+
+    async def stream(
+        self,
+        model: ModelConfig,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> AsyncIterator[str]:
+        await self._first_token()
+        for i, word in enumerate(self._words):
+            if i:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield (" " if i else "") + word
+        self._record(model, system_message, messages)
+
+    async def aclose(self):
+        pass
+
+
+def create_provider():
+    """A provider for LLM_PROVIDER, or None when its API key is missing"""
+    name = os.environ.get("LLM_PROVIDER", "emergent")
+    if name == "fake":
+        seed = os.environ.get("LLM_FAKE_SEED")
+        return FakeProvider(
+            latency=os.environ.get("LLM_FAKE_LATENCY", "lognormal:0.8,0.4"),
+            tokens_per_second=float(os.environ.get("LLM_FAKE_TOKENS_PER_SECOND", 50)),
+            reply_tokens=int(os.environ.get("LLM_FAKE_REPLY_TOKENS", 120)),
+            error_rate=float(os.environ.get("LLM_FAKE_ERROR_RATE", 0)),
+            seed=int(seed) if seed else None
+        )
+    if name == "openai":
+        if os.environ.get("OPENAI_API_KEY"):
+            return OpenAIProvider(
+                os.environ["OPENAI_API_KEY"],
+                base_url=os.environ.get("OPENAI_BASE_URL"),
+                max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", 20))
+            )
+    elif os.environ.get("EMERGENT_LLM_KEY"):
+        return EmergentProvider(os.environ["EMERGENT_LLM_KEY"])
+    return None
+
+
+class LLMClientPool:
+    """The provider shared by every request in this process"""
+
+    def __init__(self):
+        self._provider = None
+        self._started = False
+
+    def start(self):
+        if not self._started:
+            self._provider = create_provider()
+            self._started = True
+
+    def get(self):
+        # Scripts and tests may call in without a server startup
+        self.start()
+        return self._provider
+
+    async def close(self):
+        if self._provider is not None:
+            await self._provider.aclose()
+        self._provider = None
+        self._started = False
+
+
+clients = LLMClientPool()
+
+
+def get_provider():
+    """The configured provider, or None when its API key is missing"""
+    return clients.get()
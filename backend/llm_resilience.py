@@ -0,0 +1,298 @@
+"""
+Deadlines, hedging and a circuit breaker for upstream LLM calls.
+
+An LLMGuard wraps each provider call:
+
+- Deadline: a call that has not answered within deadline_seconds is
+  cancelled and raises DeadlineExceeded. For streams the deadline applies
+  to the first token and to each gap between tokens.
+- Hedging (optional): once a call has taken longer than the chosen
+  percentile of recent upstream latencies, a second identical request is
+  sent and whichever answers first wins. hedge_budget caps the share of
+  calls that may be hedged, so a slow provider is not sent double load,
+  and a hedge needs a scheduler slot of its own: it is skipped when none
+  is free.
+- Circuit breaker: after failure_threshold consecutive failures calls fail
+  fast with CircuitOpen for reset_seconds; then a single probe call is let
+  through and closes the breaker again if it succeeds.
+
+Callers answer LLMUnavailable (DeadlineExceeded or CircuitOpen) with a
+cached or fast-path reply where they have one.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from llm_scheduler import FairScheduler, Overloaded
+from metrics import LLM_CIRCUIT_STATE, LLM_GUARD_EVENTS, LLM_HEDGE_DELAY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailable(Exception):
+    """The model cannot answer right now; retry_after is in whole seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class DeadlineExceeded(LLMUnavailable):
+    pass
+
+
+class CircuitOpen(LLMUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, model: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._probing = False
+        LLM_CIRCUIT_STATE.set(0, model=model)
+
+    def check(self):
+        """Raise CircuitOpen if calls are failing fast, without claiming the
+        probe; lets callers give up before queueing for a slot"""
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                self._reject(remaining)
+
+    def admit(self):
+        """Raise CircuitOpen unless a call may go upstream now"""
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_seconds - time.monotonic()
+            if remaining > 0:
+                self._reject(remaining)
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self._reject(1)
+            self._probing = True
+
+    def success(self):
+        self.failures = 0
+        self._probing = False
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            if self.state != self.OPEN:
+                self.opened += 1
+                self._transition(self.OPEN)
+
+    def release(self):
+        """The admitted call never reached the provider (rejected locally or
+        cancelled): let another call probe instead"""
+        self._probing = False
+
+    def _reject(self, retry_after: float):
+        self.rejected += 1
+        LLM_GUARD_EVENTS.inc(model=self.model, event="circuit_rejected")
+        raise CircuitOpen("AI service is temporarily unavailable, please retry shortly", retry_after)
+
+    def _transition(self, state: str):
+        logger.warning(f"LLM circuit for {self.model} {self.state} -> {state}")
+        self.state = state
+        LLM_CIRCUIT_STATE.set(self.STATE_VALUES[state], model=self.model)
+        LLM_GUARD_EVENTS.inc(model=self.model, event=f"circuit_{state}")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+class LLMGuard:
+    def __init__(
+        self,
+        model: str,
+        deadline_seconds: float = 30.0,
+        hedge_quantile: Optional[float] = None,
+        hedge_min_seconds: float = 1.0,
+        hedge_budget: float = 0.1,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        min_samples: int = 20
+    ):
+        self.model = model
+        self.deadline_seconds = deadline_seconds
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.breaker = CircuitBreaker(model, failure_threshold, reset_seconds)
+
+        # Recent successful upstream latencies, for the hedging threshold
+        self._latencies: Deque[float] = deque(maxlen=512)
+        self.calls = 0
+        self.timeouts = 0
+        self.hedged = 0
+        self.hedges_won = 0
+        self.hedges_skipped = 0
+
+    @asynccontextmanager
+    async def call(self):
+        """
+        Admission through the circuit breaker for one logical call, and its
+        outcome. Local rejections (Overloaded) and cancellations do not count
+        against the provider. Enter it once the call holds its scheduler
+        slot, so a half-open probe is not held up in the queue.
+        """
+        self.breaker.admit()
+        try:
+            yield
+        except (Overloaded, asyncio.CancelledError, GeneratorExit):
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which to hedge a call, or None not to"""
+        if self.hedge_quantile is None or len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        delay = max(self.hedge_min_seconds, ordered[min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))])
+        LLM_HEDGE_DELAY_SECONDS.set(delay, model=self.model)
+        return delay
+
+    def _may_hedge(self) -> bool:
+        return self.hedged < self.hedge_budget * self.calls
+
+    def _timed_out(self) -> DeadlineExceeded:
+        self.timeouts += 1
+        LLM_GUARD_EVENTS.inc(model=self.model, event="timeout")
+        return DeadlineExceeded(
+            f"AI service did not answer within {self.deadline_seconds:g}s, please retry",
+            self.deadline_seconds
+        )
+
+    async def _attempt(self, provider, model, system_message, messages, session_id) -> str:
+        started = time.perf_counter()
+        reply = await provider.complete(model, system_message, messages, session_id)
+        self._latencies.append(time.perf_counter() - started)
+        return reply
+
+    async def complete(
+        self,
+        provider,
+        model,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str,
+        slots: Optional[FairScheduler] = None
+    ) -> str:
+        """provider.complete within the deadline, hedged if it runs slow.
+        With `slots`, a hedge holds a slot of its own for `session_id`."""
+        self.calls += 1
+        deadline = time.monotonic() + self.deadline_seconds
+        primary = asyncio.ensure_future(
+            self._attempt(provider, model, system_message, messages, session_id)
+        )
+        attempts = [primary]
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and delay < self.deadline_seconds:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done and self._may_hedge():
+                    if slots is not None and not slots.try_acquire(session_id):
+                        # Saturated: a hedge would jump the queue or exceed the cap
+                        self.hedges_skipped += 1
+                        LLM_GUARD_EVENTS.inc(model=self.model, event="hedge_skipped")
+                    else:
+                        self.hedged += 1
+                        LLM_GUARD_EVENTS.inc(model=self.model, event="hedge_sent")
+                        hedge = asyncio.ensure_future(
+                            self._attempt(provider, model, system_message, messages, session_id)
+                        )
+                        if slots is not None:
+                            hedge.add_done_callback(lambda _: slots.release(session_id))
+                        attempts.append(hedge)
+
+            pending = set(attempts)
+            while pending:
+                remaining = deadline - time.monotonic()
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(remaining, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise self._timed_out()
+                winners = [a for a in done if a.exception() is None]
+                if winners:
+                    if winners[0] is not primary:
+                        self.hedges_won += 1
+                        LLM_GUARD_EVENTS.inc(model=self.model, event="hedge_won")
+                    return winners[0].result()
+            # Every attempt failed
+            raise primary.exception()
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+                elif not attempt.cancelled():
+                    attempt.exception()
+
+    async def stream(
+        self,
+        provider,
+        model,
+        system_message: str,
+        messages: List[Dict[str, str]],
+        session_id: str
+    ) -> AsyncIterator[str]:
+        """provider.stream with the deadline on the first token and on every
+        gap after it. Streams are not hedged."""
+        self.calls += 1
+        deltas = provider.stream(model, system_message, messages, session_id).__aiter__()
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(deltas.__anext__(), self.deadline_seconds)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise self._timed_out()
+                yield delta
+        finally:
+            await deltas.aclose()
+
+    def stats(self) -> Dict[str, object]:
+        delay = self.hedge_delay()
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "hedging": {
+                "quantile": self.hedge_quantile,
+                "delay_seconds": round(delay, 3) if delay is not None else None,
+                "sent": self.hedged,
+                "won": self.hedges_won,
+                "skipped": self.hedges_skipped,
+            },
+            "circuit": self.breaker.stats(),
+        }
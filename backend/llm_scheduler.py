@@ -0,0 +1,191 @@
+"""
+Admission control for upstream LLM calls.
+
+A FairScheduler caps how many provider calls run at once. Callers beyond
+the cap wait in a bounded queue that is served round-robin across
+sessions. No session may hold more than a few slots or queue more than a
+few waiters, so one busy tab cannot starve or crowd out everyone else. A
+request that cannot be served in time is rejected straight away with a
+retry hint instead of piling onto the queue.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict
+
+
+class Overloaded(Exception):
+    """Raised when a call is not admitted; retry_after is in whole seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"AI service is busy ({reason}), please retry shortly")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_per_session: int = 2,
+        max_queue: int = 64,
+        max_queued_per_session: int = 4,
+        max_wait_seconds: float = 10.0,
+        initial_service_seconds: float = 3.0
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_session = max_per_session
+        self.max_queue = max_queue
+        self.max_queued_per_session = max_queued_per_session
+        self.max_wait_seconds = max_wait_seconds
+
+        self._running = 0
+        self._held: Dict[str, int] = {}
+        # Sessions with waiters in round-robin order, each with its own FIFO
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._queued = 0
+
+        # Moving average of how long a slot is held, for wait estimates
+        self._service_seconds = initial_service_seconds
+        self._waits: Deque[float] = deque(maxlen=1024)
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = {"session_queue_full": 0, "queue_full": 0, "deadline": 0, "timeout": 0}
+        self.peak_queue = 0
+
+    def estimated_wait(self, position: int) -> float:
+        """Seconds until the `position`th waiter (1-based) should get a slot"""
+        return math.ceil(position / self.max_concurrent) * self._service_seconds
+
+    @asynccontextmanager
+    async def slot(self, session_id: str):
+        """Hold one upstream slot for `session_id` for the duration of the block"""
+        await self.acquire(session_id)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            self._service_seconds += 0.2 * (held - self._service_seconds)
+            self.release(session_id)
+
+    async def acquire(self, session_id: str):
+        if self._running < self.max_concurrent and self._held.get(session_id, 0) < self.max_per_session:
+            self._grant(session_id)
+            self._waits.append(0.0)
+            return
+
+        queued_for_session = len(self._waiting.get(session_id, ()))
+        if queued_for_session >= self.max_queued_per_session:
+            # Only this session waits behind its own queued calls
+            self._reject(
+                "session_queue_full",
+                self.estimated_wait(queued_for_session * len(self._waiting) + 1)
+            )
+        if self._queued >= self.max_queue:
+            self._reject("queue_full", self.estimated_wait(self._queued + 1))
+        estimate = self.estimated_wait(self._queued + 1)
+        if estimate > self.max_wait_seconds:
+            self._reject("deadline", estimate)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(session_id, deque()).append(waiter)
+        self._queued += 1
+        self.peak_queue = max(self.peak_queue, self._queued)
+        self.waited += 1
+        enqueued = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait_seconds)
+        except BaseException as e:
+            if waiter.done():
+                # Granted just as we gave up: hand the slot back
+                self.release(session_id)
+            else:
+                waiter.cancel()
+                self._forget(session_id, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout", self.estimated_wait(self._queued + 1))
+            raise
+        self._waits.append(time.monotonic() - enqueued)
+
+    def try_acquire(self, session_id: str) -> bool:
+        """Take a slot only if one is free now and nobody is queued for it"""
+        if (self._waiting or self._running >= self.max_concurrent
+                or self._held.get(session_id, 0) >= self.max_per_session):
+            return False
+        self._grant(session_id)
+        return True
+
+    def release(self, session_id: str):
+        self._running -= 1
+        held = self._held[session_id] - 1
+        if held:
+            self._held[session_id] = held
+        else:
+            del self._held[session_id]
+        self._dispatch()
+
+    def _grant(self, session_id: str):
+        self._running += 1
+        self._held[session_id] = self._held.get(session_id, 0) + 1
+        self.admitted += 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting sessions in turn"""
+        while self._running < self.max_concurrent and self._waiting:
+            for session_id, waiters in self._waiting.items():
+                if self._held.get(session_id, 0) < self.max_per_session:
+                    break
+            else:
+                return  # every waiting session is at its own limit
+
+            waiter = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._waiting.move_to_end(session_id)
+            else:
+                del self._waiting[session_id]
+            self._grant(session_id)
+            waiter.set_result(None)
+
+    def _forget(self, session_id: str, waiter: asyncio.Future):
+        waiters = self._waiting.get(session_id)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            self._queued -= 1
+            if not waiters:
+                del self._waiting[session_id]
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected[reason] += 1
+        raise Overloaded(reason, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = list(self._waits)
+        return {
+            "in_flight": self._running,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self._queued,
+            "peak_queue_depth": self.peak_queue,
+            "max_queue": self.max_queue,
+            "max_queued_per_session": self.max_queued_per_session,
+            "waiting_sessions": len(self._waiting),
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "rejected": dict(self.rejected),
+            "wait_seconds": {
+                "p50": round(_percentile(waits, 0.5), 3),
+                "p95": round(_percentile(waits, 0.95), 3),
+                "max": round(max(waits), 3) if waits else 0.0,
+            },
+            "service_seconds": round(self._service_seconds, 3),
+        }
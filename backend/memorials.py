@@ -0,0 +1,185 @@
+"""
+MongoDB store for memorial pages, used by server.py.
+
+Listings are newest first on (created_at, id) and keyset-paginated: a page
+walks the (user_id, created_at, id) or (is_public, created_at, id) index
+from the cursor and stops after `limit` memorials.
+
+Condolences are append-only documents in their own collection, read
+newest first in pages on (memorial_id, timestamp, id). The memorial keeps
+only a condolence_count and the latest few in `condolences`, so
+loading a memorial costs the same however many condolences it has.
+
+Each memorial gets a permanent slug for shareable links, unique by index.
+"""
+import re
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Set by the store, not by clients
+SERVER_FIELDS = ("id", "slug", "created_at", "condolences", "condolence_count")
+
+_NON_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
+def make_slug(name: str) -> str:
+    """URL slug from a name plus a random suffix, e.g. "jane-smith-3f9a1c" """
+    base = _NON_SLUG_RE.sub("-", name.lower()).strip("-")[:60].rstrip("-")
+    suffix = uuid.uuid4().hex[:6]
+    return f"{base}-{suffix}" if base else suffix
+
+
+def newest_before(field: str, value: str, item_id: str) -> Dict[str, Any]:
+    """Match items after (field, id) in newest-first order"""
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "id": {"$lt": item_id}}
+    ]}
+
+
+class MemorialStore:
+    def __init__(self, collection, condolences, preview_size: int = 5):
+        self.collection = collection
+        self.condolences = condolences
+        # Latest condolences kept on the memorial itself
+        self.preview_size = preview_size
+
+    async def get(self, memorial_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": memorial_id}, {"_id": 0})
+
+    async def get_by_slug(self, slug: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"slug": slug}, {"_id": 0})
+
+    async def create(self, memorial: Dict[str, Any]) -> Dict[str, Any]:
+        memorial = {
+            **memorial,
+            "id": str(uuid.uuid4()),
+            "created_at": datetime.utcnow().isoformat(),
+            "condolences": [],
+            "condolence_count": 0
+        }
+        for attempt in range(3):
+            memorial["slug"] = make_slug(memorial.get("name", ""))
+            try:
+                await self.collection.insert_one(memorial)
+                break
+            except DuplicateKeyError:
+                # Slug suffix collision: draw another
+                memorial.pop("_id", None)
+                if attempt == 2:
+                    raise
+        memorial.pop("_id", None)
+        return memorial
+
+    async def update(self, memorial_id: str, memorial: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Replace a memorial's editable fields; None if it does not exist"""
+        fields = {k: v for k, v in memorial.items() if k not in SERVER_FIELDS}
+        return await self.collection.find_one_and_update(
+            {"id": memorial_id},
+            {"$set": fields},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def delete(self, memorial_id: str) -> bool:
+        result = await self.collection.delete_one({"id": memorial_id})
+        if not result.deleted_count:
+            return False
+        await self.condolences.delete_many({"memorial_id": memorial_id})
+        return True
+
+    async def add_photo(self, memorial_id: str, url: str, renditions: Dict[str, Any], max_photos: int) -> bool:
+        """Append a photo unless the memorial already has max_photos; False
+        if it does or does not exist"""
+        result = await self.collection.update_one(
+            {"id": memorial_id, f"photos.{max_photos - 1}": {"$exists": False}},
+            {"$push": {"photos": url, "photo_renditions": renditions}}
+        )
+        return result.matched_count > 0
+
+    async def add_condolence(self, memorial_id: str, condolence: Dict[str, Any]) -> bool:
+        """Store a condolence and update the memorial's count and preview;
+        False if the memorial does not exist"""
+        await self.condolences.insert_one({**condolence, "memorial_id": memorial_id})
+        result = await self.collection.update_one(
+            {"id": memorial_id},
+            {
+                "$inc": {"condolence_count": 1},
+                "$push": {"condolences": {"$each": [condolence], "$slice": -self.preview_size}}
+            }
+        )
+        if not result.matched_count:
+            await self.condolences.delete_one({"id": condolence["id"]})
+            return False
+        return True
+
+    async def condolence_page(
+        self,
+        memorial_id: str,
+        limit: int = 50,
+        after: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[List[str]]]:
+        """One page of a memorial's condolences, newest first: (condolences,
+        sort key of the last one if there are more)"""
+        query: Dict[str, Any] = {"memorial_id": memorial_id}
+        if after:
+            query.update(newest_before("timestamp", *after))
+
+        condolences = await self.condolences.find(query, {"_id": 0, "memorial_id": 0}).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+
+        next_key = None
+        if len(condolences) > limit:
+            condolences = condolences[:limit]
+            next_key = [condolences[-1]["timestamp"], condolences[-1]["id"]]
+        return condolences, next_key
+
+    async def condolences_after(self, memorial_id: str, condolence_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Up to `limit` condolences newer than `condolence_id`, oldest first,
+        for a client catching up after a reconnect"""
+        anchor = await self.condolences.find_one(
+            {"id": condolence_id, "memorial_id": memorial_id}, {"_id": 0, "timestamp": 1}
+        )
+        if not anchor:
+            return []
+        query = {"memorial_id": memorial_id, "$or": [
+            {"timestamp": {"$gt": anchor["timestamp"]}},
+            {"timestamp": anchor["timestamp"], "id": {"$gt": condolence_id}}
+        ]}
+        return await self.condolences.find(query, {"_id": 0, "memorial_id": 0}).sort(
+            [("timestamp", 1), ("id", 1)]
+        ).limit(limit).to_list(limit)
+
+    async def page(
+        self,
+        user_id: Optional[str] = None,
+        limit: int = 50,
+        after: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int], Optional[List[str]]]:
+        """
+        One page of a user's memorials, or of public memorials without a
+        user_id: (memorials, total, sort key of the last one if there are more).
+        The total is only counted for the first page, and is None after it.
+        """
+        scope = {"user_id": user_id} if user_id else {"is_public": True}
+        query = {**scope, **newest_before("created_at", *after)} if after else scope
+
+        memorials = await self.collection.find(query, {"_id": 0}).sort(
+            [("created_at", -1), ("id", -1)]
+        ).limit(limit + 1).to_list(limit + 1)
+
+        next_key = None
+        if len(memorials) > limit:
+            memorials = memorials[:limit]
+            next_key = [memorials[-1]["created_at"], memorials[-1]["id"]]
+
+        total = None
+        if not after:
+            # A single page is its own count
+            total = await self.collection.count_documents(scope) if next_key else len(memorials)
+        return memorials, total, next_key
@@ -0,0 +1,206 @@
+"""
+In-process metrics for the chat path.
+
+Histograms and counters with labels, rendered in the Prometheus text
+exposition format (or as JSON with estimated percentiles) by the servers'
+/api/metrics endpoints. Values are per worker process.
+"""
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+# Seconds; spans the fastest local stages up to slow LLM completions
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+    def snapshot(self):
+        return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[_label_key(labels)] = value
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+    def snapshot(self):
+        return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last)], sum
+        self._series: Dict[LabelKey, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1][0] += value
+
+    def observe_since(self, start: float, **labels) -> float:
+        """Observe the time since a perf_counter() reading; returns it"""
+        elapsed = time.perf_counter() - start
+        self.observe(elapsed, **labels)
+        return elapsed
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q: float, **labels) -> float:
+        series = self._series.get(_label_key(labels))
+        return self._quantile(series[0], q) if series else 0.0
+
+    def _quantile(self, counts: List[int], q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding q"""
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total[0]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+    def snapshot(self):
+        return [
+            {
+                "labels": dict(key),
+                "count": sum(counts),
+                "sum": round(total[0], 6),
+                "p50": round(self._quantile(counts, 0.5), 6),
+                "p95": round(self._quantile(counts, 0.95), 6),
+                "p99": round(self._quantile(counts, 0.99), 6),
+            }
+            for key, (counts, total) in self._series.items()
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._metrics.setdefault(name, Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, object]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+
+REGISTRY = Registry()
+
+# Where chat time goes, per model: prompt_build, queue, upstream,
+# first_token, persist, serialize and the whole request
+CHAT_STAGE_SECONDS = REGISTRY.histogram(
+    "afterlife_chat_stage_seconds", "Time spent in each stage of a chat request"
+)
+# Token usage reported by the provider, or estimated locally when it
+# reports none
+LLM_TOKENS = REGISTRY.counter(
+    "afterlife_llm_tokens_total", "Prompt and completion tokens per model"
+)
+CHAT_REQUESTS = REGISTRY.counter(
+    "afterlife_chat_requests_total", "Chat requests per model, endpoint and outcome"
+)
+
+# Upstream resilience (llm_resilience.py): breaker state (0 closed,
+# 1 half open, 2 open), the current hedging threshold, and events such as
+# timeouts, hedges, breaker rejections and fallback answers
+LLM_CIRCUIT_STATE = REGISTRY.gauge(
+    "afterlife_llm_circuit_state", "Circuit breaker state per model: 0 closed, 1 half open, 2 open"
+)
+LLM_HEDGE_DELAY_SECONDS = REGISTRY.gauge(
+    "afterlife_llm_hedge_delay_seconds", "Latency after which a hedged second request is sent"
+)
+LLM_GUARD_EVENTS = REGISTRY.counter(
+    "afterlife_llm_guard_events_total", "Deadline, hedging, circuit breaker and fallback events per model"
+)
+
+
+def record_tokens(model: str, prompt: int, completion: int, source: str = "provider"):
+    LLM_TOKENS.inc(prompt, model=model, kind="prompt", source=source)
+    LLM_TOKENS.inc(completion, model=model, kind="completion", source=source)
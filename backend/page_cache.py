@@ -0,0 +1,134 @@
+"""
+Cache of rendered JSON responses with strong ETags.
+
+Entries are keyed by URL (e.g. a memorial's slug or id) and invalidated by
+the id of the record they render, so every URL for a record goes stale
+together. Invalidations can arrive from other workers through a
+BroadcastHub topic. A worker that falls behind on them clears its whole
+cache rather than risk serving stale pages.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set
+
+
+@dataclass(frozen=True)
+class Page:
+    body: bytes
+    etag: str
+    record_id: str
+
+
+def strong_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches `etag` (weak comparison, as
+    RFC 9110 specifies for If-None-Match)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+class PageCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._pages: "OrderedDict[str, tuple]" = OrderedDict()
+        self._keys_by_record: Dict[str, Set[str]] = {}
+        self._follower: Optional[asyncio.Task] = None
+        # Bumped on every invalidation, so a render that raced one is not stored
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[Page]:
+        entry = self._pages.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            self._forget(key)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, record_id: str, body: bytes, epoch: int) -> Page:
+        """
+        Cache a page rendered from data read when `self.epoch` was `epoch`.
+        The page is returned either way, but is only stored if nothing was
+        invalidated in between.
+        """
+        page = Page(body, strong_etag(body), record_id)
+        if epoch != self.epoch:
+            return page
+        if key in self._pages:
+            self._forget(key)
+        self._pages[key] = (page, time.monotonic() + self.ttl_seconds)
+        self._keys_by_record.setdefault(record_id, set()).add(key)
+        while len(self._pages) > self.max_entries:
+            self._forget(next(iter(self._pages)))
+        return page
+
+    def invalidate(self, record_id: str):
+        self.epoch += 1
+        self.invalidations += 1
+        for key in self._keys_by_record.pop(record_id, ()):
+            self._pages.pop(key, None)
+
+    def clear(self):
+        self.epoch += 1
+        self._pages.clear()
+        self._keys_by_record.clear()
+
+    def _forget(self, key: str):
+        page, _ = self._pages.pop(key)
+        keys = self._keys_by_record.get(page.record_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_record[page.record_id]
+
+    def start(self, hub, topic: str):
+        """Apply invalidations published to `topic` on a BroadcastHub"""
+        self._follower = asyncio.create_task(self._follow(hub, topic))
+
+    async def stop(self):
+        if self._follower is not None:
+            self._follower.cancel()
+            await asyncio.gather(self._follower, return_exceptions=True)
+            self._follower = None
+
+    async def _follow(self, hub, topic: str):
+        while True:
+            with hub.subscribe(topic) as subscription:
+                async for event in subscription:
+                    self.invalidate(event["id"])
+            if not subscription.dropped:
+                return  # The hub stopped
+            self.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._pages),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
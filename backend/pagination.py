@@ -0,0 +1,50 @@
+"""
+Opaque cursor tokens for keyset pagination.
+
+A cursor records the sort key of the last item on a page, tagged with the
+ordering it belongs to, so the next page can be read with a range query
+instead of skipping over everything before it.
+"""
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence
+
+# Element types for decode_cursor's `shape`
+NUMBER = (int, float)
+OPTIONAL_NUMBER = (int, float, type(None))
+
+
+def encode_cursor(order: str, key: List[Any]) -> str:
+    payload = json.dumps({"o": order, "k": list(key)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, order: str, shape: Optional[Sequence] = None) -> List[Any]:
+    """
+    Sort key stored in a cursor; ValueError if it is malformed, was issued
+    for a different ordering or, given a `shape` (the type or types allowed
+    at each position), does not fit it
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = payload["k"]
+        cursor_order = payload["o"]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if cursor_order != order or not isinstance(key, list):
+        raise ValueError("Cursor does not match the requested ordering")
+    if shape is not None and not fits(key, shape):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def fits(key: List[Any], shape: Sequence) -> bool:
+    if len(key) != len(shape):
+        return False
+    # bool is an int subclass, but never part of a sort key
+    return all(
+        isinstance(value, types) and not isinstance(value, bool)
+        for value, types in zip(key, shape)
+    )
@@ -0,0 +1,201 @@
+"""
+Memorial photo pipeline.
+
+Uploaded photos are decoded and resized into a few renditions (thumbnail,
+card and full size), each saved as WebP and JPEG, so pages never send the
+original upload. Decoding and encoding are CPU-bound, so they run in a
+ProcessPoolExecutor rather than on the event loop.
+
+Renditions are stored content-addressed on local disk: a file's name is the
+sha256 of its bytes. Files never change once written, so they can be cached
+forever, and identical uploads share storage. A small manifest per original
+(named by the original's hash) makes re-uploading a photo free.
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+# Longest edge in pixels; images are never scaled up
+RENDITIONS = {"thumb": 160, "card": 480, "full": 1600}
+FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+           "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True})}
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg"}
+
+# Refuse decompression bombs well before Pillow's own limit
+MAX_PIXELS = 40_000_000
+
+DATA_URL_RE = re.compile(r"^data:image/[a-z0-9.+-]+;base64,", re.IGNORECASE)
+FILE_NAME_RE = re.compile(r"^([0-9a-f]{64})\.(webp|jpg)$")
+
+
+class InvalidPhoto(ValueError):
+    pass
+
+
+def render_renditions(data: bytes) -> Dict[str, Any]:
+    """
+    Decode an image and encode every rendition. Runs in a worker process:
+    {"width", "height", "renditions": {name: {"width", "height", format: bytes}}}
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_PIXELS:
+                raise InvalidPhoto("Photo is too large")
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGB")
+    except InvalidPhoto:
+        raise
+    except Exception:
+        raise InvalidPhoto("Could not read photo")
+
+    renditions = {}
+    for name, edge in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        rendition: Dict[str, Any] = {"width": resized.width, "height": resized.height}
+        for fmt, (pil_format, options) in FORMATS.items():
+            out = io.BytesIO()
+            resized.save(out, pil_format, **options)
+            rendition[fmt] = out.getvalue()
+        renditions[name] = rendition
+    return {"width": image.width, "height": image.height, "renditions": renditions}
+
+
+def decode_data_url(url: str) -> Optional[bytes]:
+    """Bytes of a base64 image data: URL, or None if `url` is not one"""
+    match = DATA_URL_RE.match(url)
+    if not match:
+        return None
+    try:
+        return base64.b64decode(url[match.end():], validate=True)
+    except (binascii.Error, ValueError):
+        raise InvalidPhoto("Photo data is not valid base64")
+
+
+class LocalPhotoStore:
+    """Content-addressed files under `root`, fanned out by hash prefix"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, name: str) -> Path:
+        return self.root / name[:2] / name[2:4] / name
+
+    def path(self, name: str) -> Optional[Path]:
+        """Path of a stored file, or None if `name` is not one"""
+        if not FILE_NAME_RE.match(name):
+            return None
+        path = self._path(name)
+        return path if path.is_file() else None
+
+    def put(self, data: bytes, extension: str) -> str:
+        """Store bytes; returns their file name"""
+        name = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        self._write(self._path(name), data)
+        return name
+
+    def manifest(self, digest: str) -> Optional[Dict[str, Any]]:
+        path = self.root / "manifests" / f"{digest}.json"
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def save_manifest(self, digest: str, manifest: Dict[str, Any]):
+        self._write(self.root / "manifests" / f"{digest}.json", json.dumps(manifest).encode())
+
+    @staticmethod
+    def _write(path: Path, data: bytes):
+        if path.exists():
+            return  # Same name, same content
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class PhotoPipeline:
+    def __init__(self, store: LocalPhotoStore, url_prefix: str, max_workers: Optional[int] = None,
+                 max_bytes: int = 15 * 1024 * 1024):
+        self.store = store
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.processed = 0
+        self.reused = 0
+
+    def start(self):
+        # Not fork: this process already runs Motor's and asyncio's threads,
+        # and a forked child can inherit a lock one of them held
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("forkserver")
+        )
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def url(self, name: str) -> str:
+        return f"{self.url_prefix}/{name}"
+
+    async def ingest(self, data: bytes) -> Dict[str, Any]:
+        """
+        Renditions for an uploaded photo:
+        {"id", "width", "height", "renditions": {name: {"width", "height", "webp", "jpeg"}}}
+        with URLs for each format. Raises InvalidPhoto for anything that is
+        not a readable image.
+        """
+        if len(data) > self.max_bytes:
+            raise InvalidPhoto("Photo is too large")
+        digest = hashlib.sha256(data).hexdigest()
+        manifest = self.store.manifest(digest)
+        if manifest is not None:
+            self.reused += 1
+            return manifest
+
+        if self._executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(self._executor, render_renditions, data)
+        manifest = await loop.run_in_executor(None, self._save, digest, rendered)
+        self.processed += 1
+        return manifest
+
+    def _save(self, digest: str, rendered: Dict[str, Any]) -> Dict[str, Any]:
+        renditions = {}
+        for name, rendition in rendered["renditions"].items():
+            renditions[name] = {"width": rendition["width"], "height": rendition["height"]}
+            for fmt, extension in EXTENSIONS.items():
+                renditions[name][fmt] = self.url(self.store.put(rendition[fmt], extension))
+        manifest = {
+            "id": digest,
+            "width": rendered["width"],
+            "height": rendered["height"],
+            "renditions": renditions,
+        }
+        self.store.save_manifest(digest, manifest)
+        return manifest
+
+    def stats(self) -> Dict[str, Any]:
+        return {"processed": self.processed, "reused": self.reused}
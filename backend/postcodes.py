@@ -0,0 +1,161 @@
+"""
+Offline postcode-to-coordinate lookups.
+
+Centroids live in a sorted table of fixed-size binary records that is
+memory-mapped, so uvicorn workers share the operating system's page cache
+instead of each parsing the dataset onto its own heap. The table is built
+from data/postcode_centroids.csv and rebuilt whenever the CSV changes.
+"""
+import csv
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Tuple
+
+ROOT_DIR = Path(__file__).parent
+CSV_PATH = Path(os.environ.get('POSTCODE_CSV_PATH', ROOT_DIR / 'data' / 'postcode_centroids.csv'))
+TABLE_PATH = Path(os.environ.get('POSTCODE_TABLE_PATH', ROOT_DIR / 'data' / 'postcode_centroids.bin'))
+
+# Header: magic + record count. Records: NUL-padded key, lat, lon
+MAGIC = b"PCC1"
+HEADER = struct.Struct("<4sI")
+RECORD = struct.Struct("<8sff")
+KEY_SIZE = 8
+
+AREA_RE = re.compile(r"^[A-Z]{1,2}")
+
+
+def normalize_code(code: str) -> str:
+    """
+    Canonical key for an area ("SW"), district ("SW1A") or sector ("SW1A 1")
+    """
+    compact = code.replace(" ", "").upper()
+    parts = code.strip().upper().split()
+    if len(parts) == 2 and len(parts[1]) == 1:
+        return f"{parts[0]} {parts[1]}"
+    return compact
+
+
+def lookup_keys(postcode: str, areas: bool = True):
+    """
+    Keys to try for a postcode, from the most to the least precise; without
+    `areas`, only sector and district keys
+    """
+    compact = postcode.replace(" ", "").upper()
+    keys = []
+    if len(compact) >= 5:
+        outward, inward = compact[:-3], compact[-3:]
+        keys.append(f"{outward} {inward[0]}")
+    else:
+        outward = compact
+    area = AREA_RE.match(outward)
+    if area and area.group(0) == outward:
+        # A bare area code such as "E" is only as precise as its area row
+        if areas:
+            keys.append(outward)
+        return keys
+    keys.append(outward)
+    if area and areas:
+        keys.append(area.group(0))
+    return keys
+
+
+def build_table(csv_path: Path = CSV_PATH, table_path: Path = TABLE_PATH) -> int:
+    """Compile the centroid CSV into the sorted binary table"""
+    rows = {}
+    with open(csv_path, newline="") as f:
+        lines = (line for line in f if not line.startswith("#"))
+        for row in csv.DictReader(lines):
+            key = normalize_code(row["code"]).encode("ascii")
+            if not key or len(key) > KEY_SIZE:
+                raise ValueError(f"Invalid postcode key: {row['code']!r}")
+            rows[key] = (float(row["lat"]), float(row["lon"]))
+
+    table_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file and rename so concurrent workers never map a
+    # half-written table
+    fd, tmp_path = tempfile.mkstemp(dir=table_path.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as out:
+        out.write(HEADER.pack(MAGIC, len(rows)))
+        for key in sorted(rows):
+            lat, lon = rows[key]
+            out.write(RECORD.pack(key, lat, lon))
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, table_path)
+    return len(rows)
+
+
+class CentroidTable:
+    """Binary search over a memory-mapped centroid table"""
+
+    def __init__(self, table_path: Path = TABLE_PATH):
+        with open(table_path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{table_path} is not a postcode centroid table")
+
+    def get(self, key: str) -> Optional[Tuple[float, float]]:
+        needle = key.encode("ascii", "ignore").ljust(KEY_SIZE, b"\0")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * RECORD.size
+            candidate = self._mm[offset:offset + KEY_SIZE]
+            if candidate < needle:
+                lo = mid + 1
+            elif candidate > needle:
+                hi = mid
+            else:
+                _, lat, lon = RECORD.unpack_from(self._mm, offset)
+                # float32 storage is good to about a metre
+                return round(lat, 5), round(lon, 5)
+        return None
+
+    def close(self):
+        self._mm.close()
+
+
+_table: Optional[CentroidTable] = None
+
+
+def get_table() -> CentroidTable:
+    global _table
+    if _table is None:
+        stale = not TABLE_PATH.exists() or (
+            CSV_PATH.exists() and CSV_PATH.stat().st_mtime > TABLE_PATH.stat().st_mtime
+        )
+        if stale:
+            build_table()
+        _table = CentroidTable()
+    return _table
+
+
+@lru_cache(maxsize=8192)
+def resolve_postcode(postcode: str, areas: bool = True) -> Optional[Tuple[float, float]]:
+    """
+    Coordinates (lat, lon) for a postcode, using the most precise centroid
+    available (sector, then district, then area). With areas=False only
+    sector and district rows count, for callers with a better fallback than
+    an area's town centre.
+    """
+    table = get_table()
+    for key in lookup_keys(postcode, areas):
+        point = table.get(key)
+        if point is not None:
+            return point
+    return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        count = build_table()
+        print(f"Wrote {count} postcode centroids to {TABLE_PATH}")
+    else:
+        for postcode in sys.argv[1:]:
+            print(postcode, resolve_postcode(postcode))
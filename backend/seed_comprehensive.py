@@ -1,6 +1,7 @@
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import random
+from suppliers import prepare_supplier
 
 MONGO_URL = 'mongodb://localhost:27017'
 DB_NAME = 'afterlife_db'
@@ -120,7 +121,7 @@ async def seed_comprehensive_coverage():
         for i in range(2):
             name = random.choice(FUNERAL_DIRECTORS)
             
-            # Generate mock coordinates (not used in current search but good to have)
+            # Generate mock coordinates
             lat = random.uniform(50.0, 57.0)
             lon = random.uniform(-5.0, 2.0)
             
@@ -149,6 +150,9 @@ async def seed_comprehensive_coverage():
             })
             supplier_id += 1
     
+    for supplier in suppliers:
+        prepare_supplier(supplier)
+    
     # Insert in batches for performance
     batch_size = 100
     for i in range(0, len(suppliers), batch_size):
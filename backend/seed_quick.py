@@ -1,6 +1,7 @@
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+from suppliers import prepare_supplier
 
 async def seed_suppliers():
     client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
@@ -51,6 +52,8 @@ async def seed_suppliers():
         {"id": "20", "name": "Cardiff Funeral Care", "type": "funeral_director", "postcode": "CF10 1AA", "address": "67 Queen Street, Cardiff", "phone": "029 2034 5678", "verified": True, "available": True, "rating": 4.6, "lat": 51.4816, "lon": -3.1791},
     ]
     
+    for supplier in suppliers:
+        prepare_supplier(supplier)
     await db.suppliers.insert_many(suppliers)
     print(f"✅ Seeded {len(suppliers)} suppliers")
 
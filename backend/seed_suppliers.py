@@ -3,6 +3,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
 import random
+from suppliers import prepare_supplier
 
 load_dotenv()
 
@@ -207,6 +208,8 @@ async def seed_suppliers():
         supplier_id += 1
     
     # Insert all suppliers
+    for supplier in suppliers:
+        prepare_supplier(supplier)
     await db.suppliers.insert_many(suppliers)
     print(f"✅ Seeded {len(suppliers)} suppliers across {len(UK_POSTCODES)} locations")
     print(f"   - Funeral Directors: {len([s for s in suppliers if s['type'] == 'funeral_director'])}")
@@ -1,20 +1,50 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse, FileResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 import os
+import asyncio
+import json
+import logging
 from dotenv import load_dotenv
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 import uuid
+import hashlib
+import time
 from datetime import datetime
 import base64
 
+from supplier_catalog import SupplierCatalog
+from supplier_ranking import SupplierRanker
+from postcodes import resolve_postcode
+from memorials import MemorialStore
+from broadcast import BroadcastHub, CappedCollectionChannel
+from page_cache import PageCache, etag_matches
+from photos import CONTENT_TYPES, InvalidPhoto, LocalPhotoStore, PhotoPipeline, decode_data_url
+from database import db, memorials as memorials_collection, condolences as condolences_collection, create_indexes
+from pagination import NUMBER, encode_cursor, decode_cursor
+from llm import ModelConfig, clients as llm_clients
+from sse import KEEPALIVE, SSE_HEADERS, format_sse, once, started
+from chat_cache import ResponseCache, cache_key
+from chat_service import ChatService, LLMNotConfigured
+from chat_history import client_history, with_summary
+from llm_resilience import LLMGuard, LLMUnavailable
+from llm_scheduler import FairScheduler, Overloaded
+from intents import KeywordMatcher
+from guidance import core_facts, fallback_answer, get_jurisdiction_guidance, quick_answer
+from metrics import REGISTRY, CHAT_STAGE_SECONDS, CHAT_REQUESTS
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="AfterLife API", version="1.0.0")
 
 # CORS Configuration - Restrict to known origins in production
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
+# Proxies in front of the app that append the client's address to
+# X-Forwarded-For (1 behind Render's load balancer); 0 ignores the header
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +54,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Database setup left running in the background by startup
+STARTUP_TASKS: List[asyncio.Task] = []
+
+@app.on_event("startup")
+async def startup():
+    # Create the shared LLM client (and its connection pool) once
+    llm_clients.start()
+    # Index creation waits for MongoDB, so it must not hold up startup: the
+    # chat and supplier endpoints work without a database
+    STARTUP_TASKS.append(asyncio.create_task(create_indexes()))
+    await MEMORIAL_EVENTS.start()
+    MEMORIAL_PAGES.start(MEMORIAL_EVENTS, PAGE_INVALIDATIONS)
+    PHOTO_PIPELINE.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    for task in STARTUP_TASKS:
+        task.cancel()
+    await asyncio.gather(*STARTUP_TASKS, return_exceptions=True)
+    STARTUP_TASKS.clear()
+    PHOTO_PIPELINE.stop()
+    await MEMORIAL_PAGES.stop()
+    await MEMORIAL_EVENTS.stop()
+    await llm_clients.close()
+
 # ============================================
 # Models
 # ============================================
@@ -73,6 +128,7 @@ class Memorial(BaseModel):
     name: str
     date_of_birth: str = Field(alias="dateOfBirth")
     date_of_death: str = Field(alias="dateOfDeath")
+    slug: Optional[str] = None
     biography: Optional[str] = ""
     photos: List[str] = []
     condolences: List[Dict[str, Any]] = []
@@ -236,7 +292,47 @@ SUPPLIERS_DB: List[Dict] = [
     },
 ]
 
-MEMORIALS_DB: List[Dict] = []
+SUPPLIER_CATALOG = SupplierCatalog(SUPPLIERS_DB)
+# Distance ranking for `near` searches, placing each supplier at its
+# postcode's centroid from the offline table
+SUPPLIER_RANKER = SupplierRanker(
+    {"id": s["id"], "type": s["type"], "lat": point[0], "lon": point[1]}
+    for s in SUPPLIERS_DB
+    for point in [resolve_postcode(s["postcode"])] if point is not None
+)
+
+# Memorials live in MongoDB so they survive restarts and are shared by workers
+MEMORIAL_STORE = MemorialStore(
+    memorials_collection,
+    condolences_collection,
+    preview_size=int(os.getenv("CONDOLENCE_PREVIEW_SIZE", "5"))
+)
+
+# New condolences pushed to open memorial pages (topic: the memorial id)
+# and page cache invalidations. Workers share events through a capped
+# collection unless BROADCAST_CHANNEL=local
+MEMORIAL_EVENTS = BroadcastHub(
+    queue_size=int(os.getenv("CONDOLENCE_STREAM_QUEUE", "32")),
+    channel=CappedCollectionChannel(db) if os.getenv("BROADCAST_CHANNEL", "mongo") == "mongo" else None
+)
+CONDOLENCE_KEEPALIVE_SECONDS = 15
+
+# Rendered public memorials by slug and id, dropped whenever one changes
+MEMORIAL_PAGES = PageCache(
+    max_entries=int(os.getenv("MEMORIAL_PAGE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("MEMORIAL_PAGE_CACHE_TTL_SECONDS", "300"))
+)
+PAGE_INVALIDATIONS = "memorial-pages"
+
+# Uploaded photos are resized into thumbnail, card and full renditions in a
+# process pool and served from content-addressed files
+PHOTO_PIPELINE = PhotoPipeline(
+    LocalPhotoStore(os.getenv("PHOTO_STORAGE_DIR", os.path.join(os.path.dirname(__file__), "data", "photos"))),
+    url_prefix="/api/photos",
+    max_workers=int(os.getenv("PHOTO_WORKERS")) if os.getenv("PHOTO_WORKERS") else None
+)
+MAX_MEMORIAL_PHOTOS = 30
+
 DOCUMENTS_DB: List[Dict] = []
 QUOTES_DB: List[Dict] = []
 
@@ -252,21 +348,55 @@ async def healthz():
 # Chat Endpoints
 # ============================================
 
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Handle chat requests with LLM"""
-    try:
-        jurisdiction = request.context.get("answers", {}).get("jurisdiction", "england-wales") if request.context else "england-wales"
-        religion = request.context.get("answers", {}).get("religion", "") if request.context else ""
-        postcode = request.context.get("answers", {}).get("postcode", "") if request.context else ""
-        
-        message_lower = request.message.lower()
-        supplier_keywords = ["funeral director", "florist", "flowers", "stonemason", "headstone", 
-                          "venue", "caterer", "catering", "videographer", "find", "recommend", 
-                          "near me", "local", "supplier"]
-        is_supplier_query = any(keyword in message_lower for keyword in supplier_keywords)
-        
-        system_prompt = f"""You are a compassionate AI assistant for the AfterLife bereavement support platform. Your role is to provide accurate, empathetic guidance on the UK bereavement process.
+CHAT_MODEL = ModelConfig("openai", "gpt-4o-mini")
+
+SUPPLIER_KEYWORDS = ["funeral director", "florist", "flowers", "stonemason", "headstone", 
+                     "venue", "caterer", "catering", "videographer", "find", "recommend", 
+                     "near me", "local", "supplier"]
+SUPPLIER_MATCHER = KeywordMatcher({"supplier": SUPPLIER_KEYWORDS})
+
+# Facts from the guidance tables, quoted in the system prompt
+CORE_FACTS = core_facts()
+
+# Answers to repeated questions, per jurisdiction and religion
+CHAT_CACHE = ResponseCache(
+    max_entries=int(os.getenv("CHAT_CACHE_SIZE", "2048")),
+    ttl_seconds=float(os.getenv("CHAT_CACHE_TTL_SECONDS", str(6 * 3600)))
+)
+# Cap on concurrent upstream LLM calls, shared fairly between clients
+LLM_SCHEDULER = FairScheduler(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_per_session=int(os.getenv("LLM_MAX_PER_SESSION", "2")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+    max_queued_per_session=int(os.getenv("LLM_MAX_QUEUED_PER_SESSION", "4")),
+    max_wait_seconds=float(os.getenv("LLM_MAX_WAIT_SECONDS", "10"))
+)
+# Deadline, optional hedging and a circuit breaker around each LLM call;
+# hedging is off unless LLM_HEDGE_QUANTILE is set (e.g. 0.95)
+CHAT_GUARD = LLMGuard(
+    CHAT_MODEL.name,
+    deadline_seconds=float(os.getenv("LLM_DEADLINE_SECONDS", "30")),
+    hedge_quantile=float(os.getenv("LLM_HEDGE_QUANTILE")) if os.getenv("LLM_HEDGE_QUANTILE") else None,
+    hedge_budget=float(os.getenv("LLM_HEDGE_BUDGET", "0.1")),
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+)
+CHAT_SERVICE = ChatService(CHAT_MODEL, CHAT_CACHE, LLM_SCHEDULER, CHAT_GUARD)
+
+def chat_answers(context: Optional[Dict[str, Any]]):
+    """(jurisdiction, religion, postcode) from the triage answers in a chat context"""
+    answers = context.get("answers", {}) if context else {}
+    return (
+        answers.get("jurisdiction", "england-wales"),
+        answers.get("religion", ""),
+        answers.get("postcode", "")
+    )
+
+def build_system_prompt(context: Optional[Dict[str, Any]]) -> str:
+    """System prompt for /api/chat, specialised with the user's triage answers"""
+    jurisdiction, religion, postcode = chat_answers(context)
+    
+    return f"""You are a compassionate AI assistant for the AfterLife bereavement support platform. Your role is to provide accurate, empathetic guidance on the UK bereavement process.
 
 IMPORTANT GUIDELINES:
 - Be compassionate but factual - do not simulate emotions or act as a therapist
@@ -290,69 +420,257 @@ CONTEXT:
 - User's postcode: {postcode if postcode else "Not provided"}
 
 JURISDICTION-SPECIFIC NOTES:
-- England/Wales: 5-day registration deadline, "Probate", Tell Us Once available
-- Scotland: 8-day registration deadline, "Confirmation" (not Probate), Tell Us Once available
-- Northern Ireland: 5-day registration deadline, "Probate", Tell Us Once NOT available
+{CORE_FACTS}
 
 Provide helpful, accurate guidance based on this context."""
 
-        chat_client = LlmChat(
-            api_key=os.getenv("EMERGENT_LLM_KEY"),
-            session_id=str(uuid.uuid4()),
-            system_message=system_prompt
-        ).with_model("openai", "gpt-4o-mini")
+def chat_prompt(request: ChatRequest):
+    """
+    Cache key, system prompt and messages for a chat request. The client's
+    history is cut to a token budget, older turns summarized; only
+    questions asked without history are cacheable.
+    """
+    summary, history = client_history(request.history)
+    messages = history + [{"role": "user", "content": request.message}]
+    system_prompt = build_system_prompt(request.context)
+    key = None
+    if not summary and not history:
+        # Keyed on the whole prompt, so answers shaped by one user's triage
+        # answers (postcode included) are only reused for the same answers
+        key = cache_key(CHAT_MODEL.name, request.message, system=system_prompt)
+    return key, with_summary(system_prompt, summary), messages
+
+def client_address(http_request: Request) -> str:
+    """
+    The client's address. Behind TRUSTED_PROXY_HOPS proxies it is the
+    X-Forwarded-For entry the outermost of them appended; entries to its
+    left come from the client and can be anything.
+    """
+    if TRUSTED_PROXY_HOPS:
+        hops = [
+            hop.strip()
+            for header in http_request.headers.getlist("x-forwarded-for")
+            for hop in header.split(",") if hop.strip()
+        ]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return http_request.client.host if http_request.client else "unknown"
+
+def client_session(http_request: Request) -> str:
+    """
+    Stable, anonymous session id for the client behind a chat request, used
+    upstream and for sharing LLM capacity fairly between clients
+    """
+    address = client_address(http_request)
+    return "client-" + hashlib.sha256(address.encode()).hexdigest()[:16]
+
+def too_busy(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+def is_supplier_query(message: str) -> bool:
+    return SUPPLIER_MATCHER.matches(message)
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, http_request: Request):
+    """Handle chat requests with LLM, answering simple factual questions
+    straight from the guidance tables"""
+    received = time.perf_counter()
+    outcome = "error"
+    try:
+        jurisdiction, _, _ = chat_answers(request.context)
+        response_text = quick_answer(request.message, jurisdiction)
+        tool_used = "guidance" if response_text is not None else None
+        if response_text is None:
+            with CHAT_STAGE_SECONDS.time(model=CHAT_MODEL.name, stage="prompt_build"):
+                key, system_prompt, messages = chat_prompt(request)
+            try:
+                response_text = await CHAT_SERVICE.complete(
+                    key, system_prompt, messages, client_session(http_request)
+                )
+            except LLMUnavailable:
+                # Provider timed out or is failing: answer from the guidance
+                response_text, tool_used = fallback_answer(), "fallback"
         
-        user_message = UserMessage(text=request.message)
-        response_text = await chat_client.send_message(user_message)
+        suggested_action = "marketplace" if is_supplier_query(request.message) else None
         
-        suggested_action = "marketplace" if is_supplier_query else None
+        with CHAT_STAGE_SECONDS.time(model=CHAT_MODEL.name, stage="serialize"):
+            body = ChatResponse(
+                response=response_text,
+                tool_used=tool_used,
+                suggested_action=suggested_action
+            ).model_dump_json()
         
-        return ChatResponse(
-            response=response_text,
-            tool_used=None,
-            suggested_action=suggested_action
-        )
+        outcome = tool_used or "ok"
+        CHAT_STAGE_SECONDS.observe_since(received, model=CHAT_MODEL.name, stage="request")
+        return Response(content=body, media_type="application/json")
         
+    except LLMNotConfigured as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Overloaded as e:
+        outcome = "rejected"
+        raise too_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
+    finally:
+        CHAT_REQUESTS.inc(model=CHAT_MODEL.name, endpoint="chat", outcome=outcome)
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Streaming variant of /api/chat: server-sent "message" events carrying
+    text deltas, then a "done" event with the full ChatResponse (or an
+    "error" event)
+    """
+    received = time.perf_counter()
+    jurisdiction, _, _ = chat_answers(request.context)
+    answer = quick_answer(request.message, jurisdiction)
+    if answer is None and not CHAT_SERVICE.configured:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+    
+    # Admission happens before the response starts so overload is a 429
+    tool_used = "guidance" if answer is not None else None
+    try:
+        if answer is not None:
+            deltas = once(answer)
+        else:
+            with CHAT_STAGE_SECONDS.time(model=CHAT_MODEL.name, stage="prompt_build"):
+                key, system_prompt, messages = chat_prompt(request)
+            try:
+                deltas = await started(CHAT_SERVICE.stream(
+                    key, system_prompt, messages, client_session(http_request)
+                ))
+            except LLMUnavailable:
+                deltas, tool_used = once(fallback_answer()), "fallback"
+    except Overloaded as e:
+        CHAT_REQUESTS.inc(model=CHAT_MODEL.name, endpoint="chat_stream", outcome="rejected")
+        raise too_busy(e)
+    except Exception as e:
+        CHAT_REQUESTS.inc(model=CHAT_MODEL.name, endpoint="chat_stream", outcome="error")
+        raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
+    
+    async def events():
+        chunks = []
+        outcome = "error"
+        try:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield format_sse({"delta": delta})
+            
+            with CHAT_STAGE_SECONDS.time(model=CHAT_MODEL.name, stage="serialize"):
+                done = format_sse(ChatResponse(
+                    response="".join(chunks),
+                    tool_used=tool_used,
+                    suggested_action="marketplace" if is_supplier_query(request.message) else None
+                ).model_dump(), event="done")
+            
+            outcome = tool_used or "ok"
+            CHAT_STAGE_SECONDS.observe_since(received, model=CHAT_MODEL.name, stage="request")
+            yield done
+        except Exception as e:
+            yield format_sse({"detail": f"Error processing chat request: {str(e)}"}, event="error")
+        finally:
+            CHAT_REQUESTS.inc(model=CHAT_MODEL.name, endpoint="chat_stream", outcome=outcome)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/metrics")
+async def get_metrics(format: str = "prometheus"):
+    """Chat stage latency histograms, token counts and request outcomes for
+    this worker, as Prometheus text (or format=json)"""
+    if format == "json":
+        return REGISTRY.snapshot()
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/chat/cache/stats")
+async def get_chat_cache_stats():
+    """Answer cache, request coalescing, admission control and upstream
+    resilience counters for chat"""
+    return CHAT_SERVICE.stats()
 
 # ============================================
 # Supplier Endpoints
 # ============================================
 
+# Catalog sort keys: (catalog position,), (-relevance score, catalog
+# position) or (distance in miles, id)
+CATALOG_CURSOR_SHAPES = {"catalog": (int,), "relevance": (NUMBER, int), "distance": (NUMBER, str)}
+
 @app.get("/api/suppliers")
 async def get_suppliers(
     type: Optional[str] = None,
     location: Optional[str] = None,
     postcode: Optional[str] = None,
-    search: Optional[str] = None
+    search: Optional[str] = None,
+    near: Optional[str] = None,
+    radius_miles: float = Query(25.0, gt=0, le=500),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None
 ):
-    """Get suppliers with optional filtering"""
-    results = SUPPLIERS_DB.copy()
+    """
+    Get suppliers with optional filtering and cursor pagination. With `near`
+    (a postcode), suppliers within radius_miles of it come nearest first,
+    each with its distance_miles.
+    """
+    order = "distance" if near else "relevance" if search else "catalog"
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, order, CATALOG_CURSOR_SHAPES[order])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    if type and type != "all":
-        results = [s for s in results if s["type"] == type]
+    if near:
+        return nearest_suppliers(near, radius_miles, limit or 50, after, type, location, postcode, search)
     
-    if location:
-        results = [s for s in results if location.lower() in s["location"].lower()]
+    results, total, next_key = SUPPLIER_CATALOG.page(
+        limit=limit,
+        after=after,
+        type=type if type != "all" else None,
+        location=location,
+        postcode=postcode,
+        search=search
+    )
     
-    if postcode:
-        postcode_area = postcode.split()[0].upper() if " " in postcode else postcode[:3].upper()
-        results = [s for s in results if s["postcode"].upper().startswith(postcode_area[:2])]
+    return {
+        "suppliers": results,
+        "total": total,
+        "next_cursor": encode_cursor(order, next_key) if next_key else None
+    }
+
+def nearest_suppliers(near: str, radius_miles: float, limit: int, after, type, location, postcode, search):
+    """One page of catalog suppliers by distance from the postcode `near`"""
+    point = resolve_postcode(near)
+    if point is None:
+        return {"suppliers": [], "total": 0, "next_cursor": None}
     
-    if search:
-        search_lower = search.lower()
-        results = [s for s in results if 
-                  search_lower in s["name"].lower() or 
-                  search_lower in s["description"].lower() or
-                  any(search_lower in service.lower() for service in s["services"])]
+    only = None
+    if location or postcode or search:
+        only = {s["id"] for s in SUPPLIER_CATALOG.filter(location=location, postcode=postcode, search=search)}
+    ranked, total = SUPPLIER_RANKER.rank(
+        point[0], point[1],
+        type=type if type != "all" else None,
+        limit=limit + 1,
+        radius_miles=radius_miles,
+        after=after,
+        only=only
+    )
     
-    return {"suppliers": results, "total": len(results)}
+    page = ranked[:limit]
+    results = [
+        {**SUPPLIER_CATALOG.get(supplier_id), "distance_miles": round(distance, 1)}
+        for supplier_id, distance in page
+    ]
+    next_key = [page[-1][1], page[-1][0]] if len(ranked) > limit else None
+    return {
+        "suppliers": results,
+        "total": total,
+        "next_cursor": encode_cursor("distance", next_key) if next_key else None
+    }
 
 @app.get("/api/suppliers/{supplier_id}")
 async def get_supplier(supplier_id: str):
     """Get a specific supplier by ID"""
-    supplier = next((s for s in SUPPLIERS_DB if s["id"] == supplier_id), None)
+    supplier = SUPPLIER_CATALOG.get(supplier_id)
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
     return supplier
@@ -360,7 +678,7 @@ async def get_supplier(supplier_id: str):
 @app.post("/api/suppliers/{supplier_id}/quote")
 async def request_quote(supplier_id: str, quote: QuoteRequest):
     """Request a quote from a supplier"""
-    supplier = next((s for s in SUPPLIERS_DB if s["id"] == supplier_id), None)
+    supplier = SUPPLIER_CATALOG.get(supplier_id)
     if not supplier:
         raise HTTPException(status_code=404, detail="Supplier not found")
     
@@ -384,75 +702,238 @@ async def request_quote(supplier_id: str, quote: QuoteRequest):
 # ============================================
 
 @app.get("/api/memorials")
-async def get_memorials(user_id: Optional[str] = None):
-    """Get memorials, optionally filtered by user"""
-    if user_id:
-        results = [m for m in MEMORIALS_DB if m.get("user_id") == user_id]
-    else:
-        results = [m for m in MEMORIALS_DB if m.get("is_public", True)]
-    return {"memorials": results, "total": len(results)}
+async def get_memorials(
+    user_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """Get memorials newest first, optionally filtered by user, with cursor
+    pagination; total is only given on the first page"""
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, "memorials", (str, str))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    results, total, next_key = await MEMORIAL_STORE.page(user_id=user_id, limit=limit, after=after)
+    return {
+        "memorials": results,
+        "total": total,
+        "next_cursor": encode_cursor("memorials", next_key) if next_key else None
+    }
+
+async def memorial_page(key: str, load, http_request: Request) -> Response:
+    """
+    A memorial as JSON, from the page cache if it is public, with a strong
+    ETag; 304 Not Modified when the client's If-None-Match still matches
+    """
+    page = MEMORIAL_PAGES.get(key)
+    if page is None:
+        epoch = MEMORIAL_PAGES.epoch
+        memorial = await load()
+        if not memorial:
+            raise HTTPException(status_code=404, detail="Memorial not found")
+        body = json.dumps(memorial, separators=(",", ":"), default=str).encode()
+        if not memorial.get("is_public", True):
+            return Response(content=body, media_type="application/json", headers={"Cache-Control": "private, no-store"})
+        page = MEMORIAL_PAGES.put(key, memorial["id"], body, epoch)
+    
+    # Clients and CDNs may keep the page but must revalidate it
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if etag_matches(http_request.headers.get("if-none-match"), page.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+async def memorial_changed(memorial_id: str):
+    """Drop cached pages for a memorial here and in the other workers"""
+    MEMORIAL_PAGES.invalidate(memorial_id)
+    try:
+        await MEMORIAL_EVENTS.publish(PAGE_INVALIDATIONS, {"id": memorial_id})
+    except Exception as e:
+        logger.warning(f"Could not broadcast page invalidation for memorial {memorial_id}: {str(e)}")
+
+async def memorial_photos(photos: List[str], previous: Optional[Dict] = None):
+    """
+    Photo URLs and their renditions for a memorial. Uploaded data: URLs go
+    through the photo pipeline and are replaced by their card-size WebP;
+    photos the memorial already had keep their renditions (None for
+    external links)
+    """
+    if len(photos) > MAX_MEMORIAL_PHOTOS:
+        raise HTTPException(status_code=400, detail=f"A memorial can have at most {MAX_MEMORIAL_PHOTOS} photos")
+    known = dict(zip(previous.get("photos", []), previous.get("photo_renditions", []))) if previous else {}
+    
+    async def one(photo: str):
+        data = decode_data_url(photo)
+        if data is None:
+            return photo, known.get(photo)
+        manifest = await PHOTO_PIPELINE.ingest(data)
+        return manifest["renditions"]["card"]["webp"], manifest
+    
+    try:
+        results = await asyncio.gather(*(one(photo) for photo in photos))
+    except InvalidPhoto as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return [url for url, _ in results], [manifest for _, manifest in results]
+
+@app.get("/api/memorials/slug/{slug}")
+async def get_memorial_by_slug(slug: str, http_request: Request):
+    """Get a memorial by its shareable slug"""
+    return await memorial_page(f"slug:{slug}", lambda: MEMORIAL_STORE.get_by_slug(slug), http_request)
 
 @app.get("/api/memorials/{memorial_id}")
-async def get_memorial(memorial_id: str):
+async def get_memorial(memorial_id: str, http_request: Request):
     """Get a specific memorial by ID"""
-    memorial = next((m for m in MEMORIALS_DB if m["id"] == memorial_id), None)
-    if not memorial:
-        raise HTTPException(status_code=404, detail="Memorial not found")
-    return memorial
+    return await memorial_page(f"id:{memorial_id}", lambda: MEMORIAL_STORE.get(memorial_id), http_request)
 
 @app.post("/api/memorials")
 async def create_memorial(memorial: Memorial):
     """Create a new memorial"""
     memorial_dict = memorial.model_dump(by_alias=True)
-    memorial_dict["id"] = str(uuid.uuid4())
-    memorial_dict["created_at"] = datetime.utcnow().isoformat()
-    memorial_dict["condolences"] = []
-    
-    MEMORIALS_DB.append(memorial_dict)
-    return memorial_dict
+    memorial_dict["photos"], memorial_dict["photo_renditions"] = await memorial_photos(memorial.photos)
+    return await MEMORIAL_STORE.create(memorial_dict)
 
 @app.put("/api/memorials/{memorial_id}")
 async def update_memorial(memorial_id: str, memorial: Memorial):
     """Update an existing memorial"""
-    idx = next((i for i, m in enumerate(MEMORIALS_DB) if m["id"] == memorial_id), None)
-    if idx is None:
+    previous = await MEMORIAL_STORE.get(memorial_id)
+    if not previous:
         raise HTTPException(status_code=404, detail="Memorial not found")
     
     memorial_dict = memorial.model_dump(by_alias=True)
-    memorial_dict["id"] = memorial_id
-    memorial_dict["created_at"] = MEMORIALS_DB[idx].get("created_at")
-    memorial_dict["condolences"] = MEMORIALS_DB[idx].get("condolences", [])
-    
-    MEMORIALS_DB[idx] = memorial_dict
+    memorial_dict["photos"], memorial_dict["photo_renditions"] = await memorial_photos(memorial.photos, previous)
+    memorial_dict = await MEMORIAL_STORE.update(memorial_id, memorial_dict)
+    if not memorial_dict:
+        raise HTTPException(status_code=404, detail="Memorial not found")
+    await memorial_changed(memorial_id)
     return memorial_dict
 
 @app.delete("/api/memorials/{memorial_id}")
 async def delete_memorial(memorial_id: str):
     """Delete a memorial"""
-    idx = next((i for i, m in enumerate(MEMORIALS_DB) if m["id"] == memorial_id), None)
-    if idx is None:
+    if not await MEMORIAL_STORE.delete(memorial_id):
         raise HTTPException(status_code=404, detail="Memorial not found")
-    
-    MEMORIALS_DB.pop(idx)
+    await memorial_changed(memorial_id)
     return {"success": True, "message": "Memorial deleted"}
 
 @app.post("/api/memorials/{memorial_id}/condolences")
 async def add_condolence(memorial_id: str, condolence: Condolence):
     """Add a condolence to a memorial"""
-    memorial = next((m for m in MEMORIALS_DB if m["id"] == memorial_id), None)
-    if not memorial:
-        raise HTTPException(status_code=404, detail="Memorial not found")
-    
     condolence_dict = {
         "id": str(uuid.uuid4()),
         "author": condolence.author,
         "message": condolence.message,
         "timestamp": datetime.utcnow().isoformat()
     }
-    memorial["condolences"].append(condolence_dict)
+    if not await MEMORIAL_STORE.add_condolence(memorial_id, condolence_dict):
+        raise HTTPException(status_code=404, detail="Memorial not found")
+    
+    await memorial_changed(memorial_id)
+    # Live viewers see it straight away; it is stored either way
+    try:
+        await MEMORIAL_EVENTS.publish(memorial_id, condolence_dict)
+    except Exception as e:
+        logger.warning(f"Could not broadcast condolence for memorial {memorial_id}: {str(e)}")
     
     return condolence_dict
 
+@app.get("/api/memorials/{memorial_id}/condolences/stream")
+async def stream_condolences(memorial_id: str, http_request: Request):
+    """
+    New condolences for a memorial as server-sent "condolence" events, so an
+    open memorial page updates without polling. A reconnecting client sends
+    Last-Event-ID and first gets what it missed; one that falls too far
+    behind gets a "reset" event and should reload the page.
+    """
+    if not await MEMORIAL_STORE.get(memorial_id):
+        raise HTTPException(status_code=404, detail="Memorial not found")
+    
+    # Subscribe before reading what was missed, so nothing falls in between
+    subscription = MEMORIAL_EVENTS.subscribe(memorial_id)
+    last_event_id = http_request.headers.get("last-event-id")
+    try:
+        missed = await MEMORIAL_STORE.condolences_after(memorial_id, last_event_id) if last_event_id else []
+    except Exception:
+        subscription.close()
+        raise
+    
+    async def events():
+        with subscription:
+            sent = {c["id"] for c in missed}
+            for condolence in missed:
+                yield format_sse(condolence, event="condolence", id=condolence["id"])
+            
+            updates = subscription.__aiter__()
+            while True:
+                try:
+                    condolence = await asyncio.wait_for(updates.__anext__(), CONDOLENCE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield KEEPALIVE
+                    continue
+                except StopAsyncIteration:
+                    break
+                if condolence["id"] not in sent:
+                    yield format_sse(condolence, event="condolence", id=condolence["id"])
+            
+            if subscription.dropped:
+                yield format_sse({"detail": "Too far behind, please reload"}, event="reset")
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/api/memorials/{memorial_id}/photos")
+async def upload_memorial_photo(memorial_id: str, file: UploadFile = File(...)):
+    """Add a photo to a memorial; returns its rendition URLs"""
+    data = await file.read(PHOTO_PIPELINE.max_bytes + 1)
+    try:
+        manifest = await PHOTO_PIPELINE.ingest(data)
+    except InvalidPhoto as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not await MEMORIAL_STORE.add_photo(
+        memorial_id, manifest["renditions"]["card"]["webp"], manifest, MAX_MEMORIAL_PHOTOS
+    ):
+        raise HTTPException(status_code=404, detail="Memorial not found or already has the most photos allowed")
+    await memorial_changed(memorial_id)
+    return manifest
+
+@app.get("/api/photos/{name}")
+async def get_photo(name: str):
+    """A photo rendition; its name is the hash of its content, so it never changes"""
+    path = PHOTO_PIPELINE.store.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return FileResponse(
+        path,
+        media_type=CONTENT_TYPES[path.suffix[1:]],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+@app.get("/api/memorials/{memorial_id}/condolences")
+async def get_condolences(
+    memorial_id: str,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """Get a memorial's condolences newest first, with cursor pagination"""
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, "condolences", (str, str))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    memorial = await MEMORIAL_STORE.get(memorial_id)
+    if not memorial:
+        raise HTTPException(status_code=404, detail="Memorial not found")
+    
+    results, next_key = await MEMORIAL_STORE.condolence_page(memorial_id, limit=limit, after=after)
+    return {
+        "condolences": results,
+        "total": memorial.get("condolence_count", 0),
+        "next_cursor": encode_cursor("condolences", next_key) if next_key else None
+    }
+
 # ============================================
 # Document Endpoints
 # ============================================
@@ -531,43 +1012,4 @@ async def get_guidance(
     religion: Optional[str] = None
 ):
     """Get jurisdiction-specific guidance"""
-    guidance = {
-        "england-wales": {
-            "registration_deadline": "5 days",
-            "probate_term": "Probate",
-            "tell_us_once": True,
-            "registrar_link": "https://www.gov.uk/register-a-death",
-            "key_steps": [
-                "Get the medical certificate from the doctor",
-                "Register the death within 5 days",
-                "Use Tell Us Once to notify government departments",
-                "Apply for probate if needed"
-            ]
-        },
-        "scotland": {
-            "registration_deadline": "8 days",
-            "probate_term": "Confirmation",
-            "tell_us_once": True,
-            "registrar_link": "https://www.nrscotland.gov.uk/registration/registering-a-death",
-            "key_steps": [
-                "Get the medical certificate from the doctor",
-                "Register the death within 8 days",
-                "Use Tell Us Once to notify government departments",
-                "Apply for Confirmation if needed"
-            ]
-        },
-        "northern-ireland": {
-            "registration_deadline": "5 days",
-            "probate_term": "Probate",
-            "tell_us_once": False,
-            "registrar_link": "https://www.nidirect.gov.uk/articles/registering-death",
-            "key_steps": [
-                "Get the medical certificate from the doctor",
-                "Register the death within 5 days",
-                "Notify government departments individually (Tell Us Once not available)",
-                "Apply for probate if needed"
-            ]
-        }
-    }
-    
-    return guidance.get(jurisdiction, guidance["england-wales"])
+    return get_jurisdiction_guidance(jurisdiction)
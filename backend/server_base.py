@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request, Header
-from fastapi.responses import StreamingResponse, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Header, Query
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -8,12 +8,30 @@ import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Dict, Any, Optional
+import re
 import uuid
+import time
 from datetime import datetime, timezone
 import json
 
+from database import create_indexes, backfill_supplier_fields
+from suppliers import METERS_PER_MILE, miles_to_meters, geojson_point
+from postcodes import resolve_postcode
+from supplier_ranking import EARTH_RADIUS_MILES, calculate_distance
+from pagination import NUMBER, OPTIONAL_NUMBER, encode_cursor, decode_cursor
+from llm import ModelConfig, clients as llm_clients
+from sse import SSE_HEADERS, format_sse, once, started
+from chat_cache import ResponseCache, cache_key
+from chat_service import ChatService, LLMNotConfigured
+from chat_history import HistoryManager, with_summary
+from llm_resilience import LLMGuard, LLMUnavailable
+from llm_scheduler import FairScheduler, Overloaded
+from guidance import core_facts, fallback_answer, quick_answer
+from knowledge import KnowledgeBase, with_context
+from write_behind import WriteBehindBuffer
+from metrics import REGISTRY, CHAT_STAGE_SECONDS, CHAT_REQUESTS
+
 # Import emergentintegrations
-from emergentintegrations.llm.chat import LlmChat, UserMessage
 from emergentintegrations.payments.stripe.checkout import (
     StripeCheckout,
     CheckoutSessionResponse,
@@ -39,6 +57,38 @@ if not STRIPE_API_KEY:
 client = AsyncIOMotorClient(MONGO_URL)
 db = client[DB_NAME]
 
+# Answers to repeated questions, shared between workers through MongoDB
+chat_cache = ResponseCache(
+    max_entries=int(os.environ.get('CHAT_CACHE_SIZE', 2048)),
+    ttl_seconds=float(os.environ.get('CHAT_CACHE_TTL_SECONDS', 6 * 3600)),
+    collection=db.chat_response_cache if os.environ.get('CHAT_CACHE_SHARED', 'true').lower() == 'true' else None
+)
+
+# Recent turns sent with each chat message; older ones are summarized
+chat_history = HistoryManager(
+    db.chat_messages,
+    db.chat_summaries,
+    max_turns=int(os.environ.get('CHAT_HISTORY_TURNS', 10)),
+    token_budget=int(os.environ.get('CHAT_HISTORY_TOKENS', 1500))
+)
+
+# Chat turns are saved in batches off the request path; with
+# CHAT_WRITES_DURABLE a reply waits until its turn is written
+chat_writes = WriteBehindBuffer(
+    db.chat_messages,
+    max_batch=int(os.environ.get('CHAT_WRITE_BATCH', 200)),
+    flush_interval=float(os.environ.get('CHAT_WRITE_FLUSH_SECONDS', 0.25)),
+    key_field="session_id"
+)
+CHAT_WRITES_DURABLE = os.environ.get('CHAT_WRITES_DURABLE', 'false').lower() == 'true'
+
+# Passages from our own guidance content, retrieved per chat message
+knowledge = KnowledgeBase(
+    db.guidance_data,
+    db.support_resources,
+    top_k=int(os.environ.get('KNOWLEDGE_TOP_K', 3))
+)
+
 # Create the main app
 app = FastAPI()
 
@@ -103,6 +153,9 @@ class Supplier(BaseModel):
     description: str
     services: List[str]
     pricing: Dict[str, float]  # service: price
+    min_price: Optional[float] = None  # derived from pricing on write
+    avg_price: Optional[float] = None
+    max_price: Optional[float] = None
     rating: float = 0.0
     review_count: int = 0
     verified: bool = False
@@ -153,43 +206,44 @@ class Memorial(BaseModel):
 
 # ==================== HELPERS ====================
 
+AI_MODEL = ModelConfig("openai", "gpt-4o")
+
+# Cap on concurrent upstream LLM calls, shared fairly between sessions
+llm_scheduler = FairScheduler(
+    max_concurrent=int(os.environ.get('LLM_MAX_CONCURRENCY', 8)),
+    max_per_session=int(os.environ.get('LLM_MAX_PER_SESSION', 2)),
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', 64)),
+    max_queued_per_session=int(os.environ.get('LLM_MAX_QUEUED_PER_SESSION', 4)),
+    max_wait_seconds=float(os.environ.get('LLM_MAX_WAIT_SECONDS', 10))
+)
+# Deadline, optional hedging and a circuit breaker around each LLM call;
+# hedging is off unless LLM_HEDGE_QUANTILE is set (e.g. 0.95)
+llm_guard = LLMGuard(
+    AI_MODEL.name,
+    deadline_seconds=float(os.environ.get('LLM_DEADLINE_SECONDS', 30)),
+    hedge_quantile=float(os.environ['LLM_HEDGE_QUANTILE']) if os.environ.get('LLM_HEDGE_QUANTILE') else None,
+    hedge_budget=float(os.environ.get('LLM_HEDGE_BUDGET', 0.1)),
+    failure_threshold=int(os.environ.get('LLM_BREAKER_FAILURES', 5)),
+    reset_seconds=float(os.environ.get('LLM_BREAKER_RESET_SECONDS', 30))
+)
+chat_service = ChatService(AI_MODEL, chat_cache, llm_scheduler, llm_guard)
+
 # AI System Prompt
-AI_SYSTEM_PROMPT = """You are a research-enabled bereavement guide for AfterLife, a UK platform. You have access to web search to provide accurate, current information.
+AI_SYSTEM_PROMPT = f"""You are a research-enabled bereavement guide for AfterLife, a UK platform.
 
 CRITICAL RULES:
-1. **ALWAYS SEARCH** for specific UK legal/regulatory information before answering
-2. **CITE SOURCES** - mention gov.uk, official sites when giving legal guidance
-3. Keep responses SHORT (2-4 sentences) unless providing step-by-step instructions
-4. Be DIRECT and SPECIFIC - give exact links, phone numbers, office names
-5. Include TIMEFRAMES when relevant (e.g., "within 5 days")
-6. Verify information is CURRENT (2024/2025) - UK laws change
-
-WHAT TO RESEARCH:
-- Current UK death registration procedures and timeframes
-- Local council registrar office details and booking systems
-- Current funeral costs and regulations (CMA funeral pricing rules)
-- Probate thresholds and requirements (updated annually)
-- Bereavement benefits and eligibility (DWP, HMRC)
-- Tell Us Once service availability and process
-- Regional differences (England, Wales, Scotland, Northern Ireland)
+1. Keep responses SHORT (2-4 sentences) unless providing step-by-step instructions
+2. Be DIRECT and SPECIFIC - give exact links, phone numbers, office names
+3. CITE SOURCES - mention gov.uk, official sites when giving legal guidance
+4. Include TIMEFRAMES when relevant (e.g., "within 5 days")
+5. Note regional differences (England, Wales, Scotland, Northern Ireland); UK laws change, so say when something should be checked
+6. Prefer the AfterLife guidance below when it answers the question
 
 UK-SPECIFIC CORE INFO:
-- Death registration: 5 days (England/Wales), 8 days (Scotland), 5 days (NI)
-- Tell Us Once: Available in England/Wales/Scotland (not NI) 
-- Probate threshold: £5,000 in England/Wales, £36,000 in Scotland
-- DWP bereavement: 0800 731 0469
-- HMRC bereavement: 0300 200 3300
+{core_facts()}
 - Gov.uk registrar finder: https://www.gov.uk/register-a-death
 
-EXAMPLES OF GOOD RESEARCHED RESPONSES:
-
-User: "How do I register a death in Manchester?"
-You: "Contact Manchester Register Office at 0161 234 5678 or book online at manchester.gov.uk/births-deaths-marriages. You'll need the medical certificate, your ID, and deceased's details. Appointments typically available within 3 days. You must register within 5 days of the death."
-
-User: "What's the probate threshold in Scotland?"
-You: "In Scotland, probate (called 'Confirmation') is required if the estate exceeds £36,000. For estates under this, you can often access funds without it. Visit mygov.scot/applying-for-confirmation for the application process."
-
-BE EMPATHETIC but INFORMATIVE. Research to give precise, helpful answers with sources."""
+BE EMPATHETIC but INFORMATIVE."""
 
 # Payment Packages (FIXED SERVER-SIDE)
 PAYMENT_PACKAGES = {
@@ -212,74 +266,259 @@ async def health():
 
 # ==================== AI CHAT ====================
 
+def chat_message_doc(request: ChatRequest, role: str, content: str) -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": request.session_id,
+        "user_id": request.user_id,
+        "role": role,
+        "content": content,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+def too_busy(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def chat_prompt(request: ChatRequest):
+    """
+    Cache key, system message and messages for a chat request. Only the
+    first message of a session is cacheable; follow-ups carry history.
+    """
+    await chat_writes.sync(request.session_id)
+    summary, history = await chat_history.load(request.session_id)
+    messages = history + [{"role": "user", "content": request.message}]
+    key = None
+    if not summary and not history:
+        key = cache_key(
+            AI_MODEL.name, request.message, system=AI_SYSTEM_PROMPT, knowledge=knowledge.version
+        )
+    system_message = with_context(AI_SYSTEM_PROMPT, knowledge.context(request.message))
+    return key, with_summary(system_message, summary), messages
+
 @api_router.post("/ai/chat", response_model=ChatResponse)
 async def ai_chat(request: ChatRequest):
     """
     AI-powered chat endpoint with research capabilities for UK bereavement guidance
     """
+    received = time.perf_counter()
+    outcome = "error"
     try:
-        if not EMERGENT_LLM_KEY:
-            raise HTTPException(status_code=500, detail="AI service not configured")
-        
-        # Initialize LLM chat
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=request.session_id,
-            system_message=AI_SYSTEM_PROMPT
-        ).with_model("openai", "gpt-4o")
-        
-        # Create user message
-        user_msg = UserMessage(text=request.message)
-        
-        # Send to LLM and get response
-        ai_response = await chat.send_message(user_msg)
-        
-        # Save user message
-        user_message_doc = {
-            "id": str(uuid.uuid4()),
-            "session_id": request.session_id,
-            "user_id": request.user_id,
-            "role": "user",
-            "content": request.message,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        await db.chat_messages.insert_one(user_message_doc)
+        # Answer simple factual questions from the guidance tables;
+        # otherwise send to LLM with the session's recent history (or reuse
+        # a cached or in-flight answer) and get response
+        ai_response = quick_answer(request.message)
+        source = "guidance" if ai_response is not None else "ok"
+        if ai_response is None:
+            with CHAT_STAGE_SECONDS.time(model=AI_MODEL.name, stage="prompt_build"):
+                key, system_message, messages = await chat_prompt(request)
+            try:
+                ai_response = await chat_service.complete(key, system_message, messages, request.session_id)
+            except LLMUnavailable as e:
+                # Provider timed out or is failing: answer from the guidance
+                logger.warning(f"AI chat fallback for session {request.session_id}: {str(e)}")
+                ai_response, source = fallback_answer(knowledge.context(request.message)), "fallback"
+        
+        # Save user and assistant messages
+        with CHAT_STAGE_SECONDS.time(model=AI_MODEL.name, stage="persist"):
+            await chat_writes.add(
+                [
+                    chat_message_doc(request, "user", request.message),
+                    chat_message_doc(request, "assistant", ai_response)
+                ],
+                durable=CHAT_WRITES_DURABLE
+            )
         
-        # Save assistant message
-        assistant_message_doc = {
-            "id": str(uuid.uuid4()),
-            "session_id": request.session_id,
-            "user_id": request.user_id,
-            "role": "assistant",
-            "content": ai_response,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        await db.chat_messages.insert_one(assistant_message_doc)
+        with CHAT_STAGE_SECONDS.time(model=AI_MODEL.name, stage="serialize"):
+            body = ChatResponse(
+                session_id=request.session_id,
+                message=ai_response,
+                timestamp=datetime.now(timezone.utc)
+            ).model_dump_json()
         
-        logger.info(f"AI chat completed for session {request.session_id}")
+        outcome = source
+        elapsed = CHAT_STAGE_SECONDS.observe_since(received, model=AI_MODEL.name, stage="request")
+        logger.info(f"AI chat completed for session {request.session_id} in {elapsed * 1000:.0f}ms")
         
-        return ChatResponse(
-            session_id=request.session_id,
-            message=ai_response,
-            timestamp=datetime.now(timezone.utc)
-        )
+        return Response(content=body, media_type="application/json")
     
+    except LLMNotConfigured as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Overloaded as e:
+        outcome = "rejected"
+        logger.warning(f"AI chat rejected for session {request.session_id}: {e.reason}")
+        raise too_busy(e)
     except Exception as e:
         logger.error(f"AI chat error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI chat failed: {str(e)}")
+    finally:
+        CHAT_REQUESTS.inc(model=AI_MODEL.name, endpoint="chat", outcome=outcome)
 
-@api_router.get("/ai/history/{session_id}")
-async def get_chat_history(session_id: str):
+@api_router.post("/ai/chat/stream")
+async def ai_chat_stream(request: ChatRequest):
     """
-    Get chat history for a session
+    Streaming variant of /ai/chat: sends the reply as server-sent events
+    ("message" events carrying a text delta, then one "done" event with the
+    full ChatResponse, or an "error" event) and saves the conversation turn
+    once the reply is complete
     """
+    received = time.perf_counter()
+    answer = quick_answer(request.message)
+    if answer is None and not chat_service.configured:
+        raise HTTPException(status_code=500, detail="AI service not configured")
+    
+    # Wait for admission (and the first delta) before the response starts,
+    # so a saturated service answers 429 rather than an error event
+    source = "guidance" if answer is not None else "ok"
     try:
-        messages = await db.chat_messages.find(
-            {"session_id": session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(100)
+        if answer is not None:
+            deltas = once(answer)
+        else:
+            with CHAT_STAGE_SECONDS.time(model=AI_MODEL.name, stage="prompt_build"):
+                key, system_message, messages = await chat_prompt(request)
+            try:
+                deltas = await started(
+                    chat_service.stream(key, system_message, messages, request.session_id)
+                )
+            except LLMUnavailable as e:
+                logger.warning(f"AI chat stream fallback for session {request.session_id}: {str(e)}")
+                deltas, source = once(fallback_answer(knowledge.context(request.message))), "fallback"
+    except Overloaded as e:
+        CHAT_REQUESTS.inc(model=AI_MODEL.name, endpoint="chat_stream", outcome="rejected")
+        logger.warning(f"AI chat stream rejected for session {request.session_id}: {e.reason}")
+        raise too_busy(e)
+    except Exception as e:
+        CHAT_REQUESTS.inc(model=AI_MODEL.name, endpoint="chat_stream", outcome="error")
+        logger.error(f"AI chat stream error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"AI chat failed: {str(e)}")
+    
+    async def events():
+        chunks = []
+        outcome = "error"
+        try:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield format_sse({"delta": delta})
+            
+            ai_response = "".join(chunks)
+            user_message_doc = chat_message_doc(request, "user", request.message)
+            assistant_message_doc = chat_message_doc(request, "assistant", ai_response)
+            with CHAT_STAGE_SECONDS.time(model=AI_MODEL.name, stage="persist"):
+                await chat_writes.add([user_message_doc, assistant_message_doc], durable=CHAT_WRITES_DURABLE)
+            
+            with CHAT_STAGE_SECONDS.time(model=AI_MODEL.name, stage="serialize"):
+                done = format_sse(ChatResponse(
+                    session_id=request.session_id,
+                    message=ai_response,
+                    timestamp=datetime.now(timezone.utc)
+                ).model_dump(mode="json"), event="done")
+            
+            outcome = source
+            elapsed = CHAT_STAGE_SECONDS.observe_since(received, model=AI_MODEL.name, stage="request")
+            logger.info(f"AI chat stream completed for session {request.session_id} in {elapsed * 1000:.0f}ms")
+            
+            yield done
         
-        return {"session_id": session_id, "messages": messages}
+        except Exception as e:
+            logger.error(f"AI chat stream error: {str(e)}")
+            yield format_sse({"detail": f"AI chat failed: {str(e)}"}, event="error")
+        finally:
+            CHAT_REQUESTS.inc(model=AI_MODEL.name, endpoint="chat_stream", outcome=outcome)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@api_router.get("/metrics")
+async def get_metrics(format: str = "prometheus"):
+    """
+    Chat stage latency histograms, token counts and request outcomes for
+    this worker, in Prometheus text format (or format=json with estimated
+    percentiles)
+    """
+    if format == "json":
+        return REGISTRY.snapshot()
+    return PlainTextResponse(REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/ai/cache/stats")
+async def get_chat_cache_stats():
+    """
+    Answer cache, request coalescing, admission control, upstream
+    resilience and message write counters for the chat endpoints
+    """
+    return {**chat_service.stats(), "writes": chat_writes.stats()}
+
+def history_keyset(timestamp: str, message_id: str, op: str) -> Dict[str, Any]:
+    """Match messages before ("$lt") or after ("$gt") (timestamp, id)"""
+    return {"$or": [
+        {"timestamp": {op: timestamp}},
+        {"timestamp": timestamp, "id": {op: message_id}}
+    ]}
+
+@api_router.get("/ai/history/{session_id}")
+async def get_chat_history(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since_id: Optional[str] = None
+):
+    """
+    Get chat history for a session, oldest first. Without a cursor this is
+    the latest `limit` messages; pass prev_cursor as `before` to page back
+    through older ones, and next_cursor as `after` (or a message id as
+    `since_id`) to fetch only newer ones, e.g. when polling
+    """
+    try:
+        if sum(option is not None for option in (before, after, since_id)) > 1:
+            raise HTTPException(status_code=400, detail="Use only one of before, after and since_id")
+        
+        await chat_writes.sync(session_id)
+        query: Dict[str, Any] = {"session_id": session_id}
+        direction = -1
+        # Where the page starts, so an empty page still has a cursor to poll from
+        position = before or after
+        try:
+            if before:
+                query.update(history_keyset(*decode_cursor(before, "history", (str, str)), "$lt"))
+            elif after:
+                query.update(history_keyset(*decode_cursor(after, "history", (str, str)), "$gt"))
+                direction = 1
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if since_id:
+            anchor = await db.chat_messages.find_one(
+                {"id": since_id, "session_id": session_id},
+                {"_id": 0, "timestamp": 1, "id": 1}
+            )
+            if not anchor:
+                raise HTTPException(status_code=404, detail="Message not found")
+            query.update(history_keyset(anchor["timestamp"], anchor["id"], "$gt"))
+            position = encode_cursor("history", [anchor["timestamp"], anchor["id"]])
+            direction = 1
+        
+        # Walk the (session_id, timestamp, id) index from the cursor and stop
+        # after one page, however long the session is
+        messages = await db.chat_messages.find(query, {"_id": 0}).sort(
+            [("timestamp", direction), ("id", direction)]
+        ).limit(limit + 1).to_list(limit + 1)
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if direction == -1:
+            messages.reverse()
+        
+        def cursor(message):
+            return encode_cursor("history", [message["timestamp"], message["id"]])
+        
+        # Older messages exist behind a forward page, or if we stopped early
+        older = bool(messages) and (direction == 1 or has_more)
+        return {
+            "session_id": session_id,
+            "messages": messages,
+            "has_more": has_more,
+            "prev_cursor": cursor(messages[0]) if older else None,
+            # Always set (unless the session is empty) so clients can poll
+            "next_cursor": cursor(messages[-1]) if messages else position
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -425,97 +664,239 @@ async def stripe_webhook(request: Request):
 
 # ==================== SUPPLIERS ====================
 
-def calculate_distance(lat1, lon1, lat2, lon2):
+async def resolve_postcode_point(postcode: str):
     """
-    Calculate distance between two coordinates in miles using Haversine formula
+    Coordinates for a postcode, most precise first: a sector or district row
+    in the offline centroid table, the centroid of suppliers registered under
+    the postcode or its outward code, then the table's area row and finally
+    the centroid of suppliers in the area
     """
-    from math import radians, cos, sin, asin, sqrt
+    point = resolve_postcode(postcode, areas=False)
+    if point is not None:
+        return point
     
-    # Convert to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    search_postcode = postcode.replace(" ", "").upper()
+    outward = search_postcode[:-3] if len(search_postcode) > 4 else search_postcode
+    area = re.match(r"[A-Z]{1,2}", outward)
     
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
+    patterns = [f"^{re.escape(outward)} "]
+    if len(search_postcode) > 4:
+        patterns.insert(0, f"^{re.escape(outward)} {re.escape(search_postcode[-3:])}$")
+    point = await supplier_centroid(patterns)
+    if point is not None:
+        return point
     
-    # Radius of earth in miles
-    r = 3956
-    return c * r
+    point = resolve_postcode(postcode)
+    if point is not None:
+        return point
+    if area:
+        return await supplier_centroid([f"^{area.group(0)}[0-9]"])
+    return None
+
+async def supplier_centroid(patterns):
+    """Average position of suppliers whose postcode matches the first
+    pattern that matches any"""
+    for pattern in patterns:
+        centroid = await db.suppliers.aggregate([
+            {"$match": {"postcode": {"$regex": pattern}, "location": {"$exists": True}}},
+            {"$group": {"_id": None, "lat": {"$avg": "$lat"}, "lon": {"$avg": "$lon"}}}
+        ]).to_list(1)
+        if centroid:
+            return centroid[0]["lat"], centroid[0]["lon"]
+    return None
+
+# Ordering of ranked (non-distance) searches: field and direction
+SUPPLIER_SORTS = {
+    "relevance": ("relevance", -1),
+    "rating": ("rating", -1),
+    "price": ("avg_price", 1),
+}
+
+def keyset_match(field: str, direction: int, value, last_id: str) -> Dict[str, Any]:
+    """Match documents after (value, last_id) in (field, id) order"""
+    if value is None:
+        # Missing values sort before everything ascending, after it descending
+        if direction == 1:
+            return {"$or": [{field: {"$ne": None}}, {field: None, "id": {"$gt": last_id}}]}
+        return {field: None, "id": {"$gt": last_id}}
+    if direction == 1:
+        after_value = [{field: {"$gt": value}}]
+    else:
+        after_value = [{field: {"$lt": value}}, {field: None}]
+    return {"$or": after_value + [{field: value, "id": {"$gt": last_id}}]}
+
+async def nearest_suppliers_page(point, query: Dict[str, Any], radius_miles: float, limit: int, after):
+    """
+    One page of suppliers ordered by (distance, id). Radius filtering,
+    distance sorting and the limit all run inside MongoDB against the
+    2dsphere index on `location`; later pages start at the previous page's
+    distance via minDistance instead of re-reading nearer suppliers.
+    """
+    geo_near = {
+        "near": geojson_point(*point),
+        "key": "location",
+        "distanceField": "_distance",
+        "maxDistance": miles_to_meters(radius_miles),
+        "query": query,
+        "spherical": True
+    }
+    after_stages = []
+    if after:
+        last_distance, last_id = after
+        geo_near["minDistance"] = last_distance
+        after_stages.append({"$match": {"$or": [
+            {"_distance": {"$gt": last_distance}},
+            {"id": {"$gt": last_id}}
+        ]}})
+    project = {"$project": {"_id": 0, "location": 0}}
+    
+    rows = await db.suppliers.aggregate(
+        [{"$geoNear": geo_near}, *after_stages, {"$limit": limit + 1}, project]
+    ).to_list(limit + 1)
+    
+    if len(rows) > limit and rows[limit - 1]["_distance"] == rows[limit]["_distance"]:
+        # The page boundary splits suppliers at the same distance, which
+        # $geoNear returns in no particular order: fetch the whole tie so it
+        # can be ordered by id
+        tie = rows[limit]["_distance"]
+        tied = await db.suppliers.aggregate(
+            [{"$geoNear": dict(geo_near, minDistance=tie, maxDistance=tie)}, *after_stages, project]
+        ).to_list(None)
+        rows = [row for row in rows if row["_distance"] != tie] + tied
+    
+    rows.sort(key=lambda row: (row["_distance"], row["id"]))
+    page = rows[:limit]
+    next_key = [page[-1]["_distance"], page[-1]["id"]] if len(rows) > limit else None
+    for supplier in page:
+        supplier["distance_miles"] = round(supplier.pop("_distance") / METERS_PER_MILE, 1)
+    return page, next_key
+
+def within_radius(point, query: Dict[str, Any], radius_miles: float, q: Optional[str] = None) -> Dict[str, Any]:
+    """`query` restricted to suppliers within the radius (and matching the
+    text `q`). $text cannot be combined with $geoNear, so the radius is a
+    $geoWithin filter."""
+    match = dict(query)
+    match["location"] = {"$geoWithin": {
+        "$centerSphere": [geojson_point(*point)["coordinates"], radius_miles / EARTH_RADIUS_MILES]
+    }}
+    if q:
+        match["$text"] = {"$search": q}
+    return match
+
+async def ranked_suppliers_page(point, query: Dict[str, Any], radius_miles: float,
+                                sort_by: str, q: Optional[str], limit: int, after):
+    """
+    One page of suppliers within the radius ordered by (sort field, id),
+    with distances computed for the returned page only
+    """
+    field, direction = SUPPLIER_SORTS[sort_by]
+    match = within_radius(point, query, radius_miles, q)
+    
+    project = {"$project": {"_id": 0, "location": 0}}
+    
+    if sort_by == "price":
+        # Unpriced suppliers come after every priced one, ordered by id
+        rows = []
+        if not after or after[0] is not None:
+            priced = dict(match, avg_price={"$ne": None})
+            pipeline = [{"$match": priced}]
+            if after:
+                pipeline.append({"$match": keyset_match(field, direction, *after)})
+            rows = await db.suppliers.aggregate(pipeline + [
+                {"$sort": {field: direction, "id": 1}},
+                {"$limit": limit + 1},
+                project
+            ]).to_list(limit + 1)
+        if len(rows) <= limit:
+            unpriced = dict(match, avg_price=None)
+            if after and after[0] is None:
+                unpriced["id"] = {"$gt": after[1]}
+            rows += await db.suppliers.aggregate([
+                {"$match": unpriced},
+                {"$sort": {"id": 1}},
+                {"$limit": limit + 1 - len(rows)},
+                project
+            ]).to_list(limit + 1 - len(rows))
+    else:
+        pipeline = [{"$match": match}]
+        if sort_by == "relevance":
+            pipeline.append({"$set": {"relevance": {"$meta": "textScore"}}})
+        if after:
+            pipeline.append({"$match": keyset_match(field, direction, *after)})
+        rows = await db.suppliers.aggregate(pipeline + [
+            {"$sort": {field: direction, "id": 1}},
+            {"$limit": limit + 1},
+            project
+        ]).to_list(limit + 1)
+    
+    page = rows[:limit]
+    next_key = [page[-1].get(field), page[-1]["id"]] if len(rows) > limit else None
+    for supplier in page:
+        supplier["distance_miles"] = round(
+            calculate_distance(point[0], point[1], supplier["lat"], supplier["lon"]), 1
+        )
+    return page, next_key
 
 @api_router.get("/suppliers/search")
 async def search_suppliers(
     postcode: str,
     type: Optional[str] = None,
     radius_miles: float = 5.0,
-    sort_by: str = "distance"
+    sort_by: str = "distance",
+    q: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None
 ):
     """
-    Search suppliers within radius of postcode
+    Search suppliers within radius of postcode, optionally matching free
+    text (results are then ranked by relevance). Pass the returned
+    next_cursor back as `cursor` to fetch the following page.
     """
     try:
-        # Normalize postcode (remove spaces, uppercase)
-        search_postcode = postcode.replace(" ", "").upper()
-        
-        # Get all suppliers of the requested type
-        query = {"available": True}
-        if type:
-            query["type"] = type
-        
-        all_suppliers = await db.suppliers.find(query, {"_id": 0}).to_list(500)
-        
-        # Try exact match first
-        exact_matches = []
-        for supplier in all_suppliers:
-            supplier_postcode = supplier['postcode'].replace(" ", "").upper()
-            if supplier_postcode == search_postcode:
-                supplier['distance_miles'] = 0.0
-                exact_matches.append(supplier)
-        
-        if exact_matches:
-            logger.info(f"Found {len(exact_matches)} exact postcode matches for {postcode}")
-            return {
-                "postcode": postcode,
-                "radius_miles": radius_miles,
-                "count": len(exact_matches),
-                "suppliers": exact_matches[:50]
-            }
-        
-        # Try area match (first 3-4 characters of postcode)
-        search_area = search_postcode[:4] if len(search_postcode) >= 4 else search_postcode[:3]
-        
-        matching_suppliers = []
-        for supplier in all_suppliers:
-            supplier_postcode = supplier['postcode'].replace(" ", "").upper()
-            supplier_area = supplier_postcode[:4] if len(supplier_postcode) >= 4 else supplier_postcode[:3]
+        if q:
+            sort_by = "relevance"
+        elif sort_by not in SUPPLIER_SORTS:
+            sort_by = "distance"
+        
+        after = None
+        if cursor:
+            try:
+                shape = (NUMBER, str) if sort_by == "distance" else (OPTIONAL_NUMBER, str)
+                after = decode_cursor(cursor, sort_by, shape)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
+        point = await resolve_postcode_point(postcode)
+        if point is None:
+            logger.info(f"Could not locate postcode {postcode}")
+            page, next_key, count = [], None, 0
+        else:
+            query = {"available": True}
+            if type:
+                query["type"] = type
             
-            # Match on area code
-            if supplier_area.startswith(search_area[:2]):  # At least first 2 chars match
-                # Calculate mock distance (0-10 miles)
-                distance = abs(hash(supplier_postcode) - hash(search_postcode)) % 10
-                supplier['distance_miles'] = round(distance, 1)
-                
-                if distance <= radius_miles:
-                    matching_suppliers.append(supplier)
-        
-        # Sort results
-        if sort_by == "distance":
-            matching_suppliers.sort(key=lambda x: x.get('distance_miles', 999))
-        elif sort_by == "rating":
-            matching_suppliers.sort(key=lambda x: x.get('rating', 0), reverse=True)
-        elif sort_by == "price":
-            matching_suppliers.sort(key=lambda x: sum(x.get('pricing', {}).values()) / len(x.get('pricing', {1: 1})))
-        
-        logger.info(f"Found {len(matching_suppliers)} suppliers near {postcode}")
+            if sort_by == "distance":
+                page, next_key = await nearest_suppliers_page(point, query, radius_miles, limit, after)
+            else:
+                page, next_key = await ranked_suppliers_page(
+                    point, query, radius_miles, sort_by, q, limit, after
+                )
+            # Every match within the radius, not just this page
+            count = await db.suppliers.count_documents(within_radius(point, query, radius_miles, q))
+        
+        logger.info(f"Found {len(page)} suppliers near {postcode}")
         
         return {
             "postcode": postcode,
             "radius_miles": radius_miles,
-            "count": len(matching_suppliers),
-            "suppliers": matching_suppliers[:50]
+            "count": count,
+            "page_count": len(page),
+            "suppliers": page,
+            "next_cursor": encode_cursor(sort_by, next_key) if next_key else None
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Supplier search error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -546,6 +927,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup_db_client():
+    llm_clients.start()
+    await backfill_supplier_fields()
+    await create_indexes()
+    try:
+        await knowledge.refresh()
+    except Exception as e:
+        logger.error(f"Knowledge index build failed: {str(e)}")
+    knowledge.start(poll_seconds=float(os.environ.get('KNOWLEDGE_REFRESH_SECONDS', 300)))
+    chat_writes.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await chat_writes.stop()
+    await knowledge.stop()
+    await llm_clients.close()
     client.close()
@@ -0,0 +1,110 @@
+"""
+Request coalescing for identical in-flight calls.
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, TypeVar
+
+T = TypeVar("T")
+
+
+class SharedStream:
+    """
+    One run of a stream of text pieces, buffered so that any number of
+    readers can replay what has arrived and then follow along. `call`
+    resolves to the pieces joined, or to the stream's exception.
+    """
+
+    def __init__(self, pieces: AsyncIterator[str]):
+        self.pieces: List[str] = []
+        self._arrived = asyncio.Event()
+        self.call = asyncio.ensure_future(self._pump(pieces))
+        self.call.add_done_callback(lambda _: self._wake())
+
+    async def _pump(self, pieces: AsyncIterator[str]) -> str:
+        try:
+            async for piece in pieces:
+                self.pieces.append(piece)
+                self._wake()
+        finally:
+            if hasattr(pieces, "aclose"):
+                await pieces.aclose()
+        return "".join(self.pieces)
+
+    def _wake(self):
+        self._arrived.set()
+        self._arrived = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Every piece from the first, then the stream's exception if it
+        failed"""
+        sent = 0
+        while True:
+            while sent < len(self.pieces):
+                sent += 1
+                yield self.pieces[sent - 1]
+            if self.call.done():
+                self.call.result()
+                return
+            await self._arrived.wait()
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution: the first
+    caller starts it and everyone awaits the same result or exception. A
+    cancelled caller does not cancel the shared call for the others.
+    Streams share one execution the same way, see stream().
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, SharedStream] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._finish(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(call)
+
+    async def stream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Pieces of the reply for a key. The first caller starts fn() and
+        later callers replay the pieces so far and then follow the same
+        stream. A call started by do() arrives as one piece, and do()
+        callers joining a stream get the pieces joined.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            shared = SharedStream(fn())
+            call = shared.call
+            self._calls[key] = call
+            self._streams[key] = shared
+            call.add_done_callback(lambda done: self._finish(key, done))
+            self.started += 1
+        else:
+            shared = self._streams.get(key)
+            self.coalesced += 1
+
+        if shared is None:
+            yield await asyncio.shield(call)
+            return
+        async for piece in shared.follow():
+            yield piece
+
+    def _finish(self, key: str, call: asyncio.Future):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+            self._streams.pop(key, None)
+        # Mark the exception as retrieved even if every caller went away
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self):
+        return {"in_flight": len(self._calls), "started": self.started, "coalesced": self.coalesced}
@@ -0,0 +1,48 @@
+"""
+Server-sent events helpers.
+"""
+import json
+from typing import Any, AsyncIterator, Optional
+
+# Keep proxies from buffering or caching an event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+# A comment line, sent on idle streams so proxies do not time them out
+KEEPALIVE = ": keepalive\n\n"
+
+
+def format_sse(data: Any, event: Optional[str] = None, id: Optional[str] = None) -> str:
+    """Encode one event; data is sent as JSON"""
+    lines = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def once(item: Any) -> AsyncIterator[Any]:
+    """A stream of a single item, for replies that are ready up front"""
+    yield item
+
+
+async def started(stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    Wait for the first item of `stream`, so anything it raises before
+    producing output (e.g. admission control) can still become a normal
+    HTTP error, then return an iterator over the whole stream
+    """
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        return stream
+
+    async def resumed():
+        yield first
+        async for item in stream:
+            yield item
+    return resumed()
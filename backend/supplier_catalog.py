@@ -0,0 +1,168 @@
+"""
+In-memory supplier catalog used by server.py.
+
+Secondary indexes (type, postcode area, location) map to sets of ids and
+free-text search goes through an inverted index maintained as suppliers
+are added, so a filtered listing intersects candidate sets instead of
+rescanning every supplier on each request.
+"""
+from bisect import bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from text_index import InvertedIndex
+
+# Relative weight of each searchable field in relevance ranking
+SEARCH_FIELDS = {"name": 3.0, "services": 2.0, "description": 1.0}
+
+
+def postcode_area(postcode: str) -> str:
+    """The leading characters the marketplace matches postcodes on"""
+    return postcode.upper()[:2]
+
+
+class SupplierCatalog:
+    """Supplier store with lookups by id, type, postcode area and location"""
+
+    def __init__(self, suppliers: Iterable[Dict] = ()):
+        self._by_id: Dict[str, Dict] = {}
+        self._order: Dict[str, int] = {}
+        self._next_order = 0
+        self._by_type: Dict[str, Set[str]] = {}
+        self._by_area: Dict[str, Set[str]] = {}
+        self._by_location: Dict[str, Set[str]] = {}
+        self._search = InvertedIndex(SEARCH_FIELDS)
+        for supplier in suppliers:
+            self.add(supplier)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self._sorted(self._by_id))
+
+    def get(self, supplier_id: str) -> Optional[Dict]:
+        return self._by_id.get(supplier_id)
+
+    def add(self, supplier: Dict):
+        """Add a supplier, replacing any existing one with the same id"""
+        supplier_id = supplier["id"]
+        if supplier_id in self._by_id:
+            self._unindex(supplier_id)
+        else:
+            self._order[supplier_id] = self._next_order
+            self._next_order += 1
+
+        self._by_id[supplier_id] = supplier
+        self._by_type.setdefault(supplier["type"], set()).add(supplier_id)
+        self._by_area.setdefault(postcode_area(supplier["postcode"]), set()).add(supplier_id)
+        self._by_location.setdefault(supplier["location"].lower(), set()).add(supplier_id)
+        self._search.add(supplier_id, supplier)
+
+    def remove(self, supplier_id: str) -> Optional[Dict]:
+        if supplier_id not in self._by_id:
+            return None
+        del self._order[supplier_id]
+        return self._unindex(supplier_id)
+
+    def _unindex(self, supplier_id: str) -> Dict:
+        supplier = self._by_id.pop(supplier_id)
+        self._discard(self._by_type, supplier["type"], supplier_id)
+        self._discard(self._by_area, postcode_area(supplier["postcode"]), supplier_id)
+        self._discard(self._by_location, supplier["location"].lower(), supplier_id)
+        self._search.remove(supplier_id)
+        return supplier
+
+    def filter(
+        self,
+        type: Optional[str] = None,
+        location: Optional[str] = None,
+        postcode: Optional[str] = None,
+        search: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Suppliers matching every given filter, in catalog order or, when
+        searching, by relevance
+        """
+        return [self._by_id[i] for _, i in self._ranked(type, location, postcode, search)]
+
+    def page(
+        self,
+        limit: Optional[int] = None,
+        after: Optional[Sequence] = None,
+        type: Optional[str] = None,
+        location: Optional[str] = None,
+        postcode: Optional[str] = None,
+        search: Optional[str] = None
+    ) -> Tuple[List[Dict], int, Optional[list]]:
+        """
+        One page of filter() results following the sort key `after`.
+        Returns the suppliers, the total number of matches and the sort key
+        of the page's last supplier when more follow.
+        """
+        ranked = self._ranked(type, location, postcode, search)
+        start = 0
+        if after is not None:
+            start = bisect_right([key for key, _ in ranked], tuple(after))
+        end = len(ranked) if limit is None else min(start + limit, len(ranked))
+        page = [self._by_id[i] for _, i in ranked[start:end]]
+        next_key = list(ranked[end - 1][0]) if end < len(ranked) else None
+        return page, len(ranked), next_key
+
+    def _ranked(self, type, location, postcode, search) -> List[Tuple[tuple, str]]:
+        """(sort key, id) pairs of the matching suppliers, in order"""
+        candidates: List[Set[str]] = []
+
+        if type:
+            candidates.append(self._by_type.get(type, set()))
+
+        if location:
+            location_lower = location.lower()
+            candidates.append(self._union(
+                ids for name, ids in self._by_location.items() if location_lower in name
+            ))
+
+        if postcode:
+            area = postcode.split()[0].upper() if " " in postcode else postcode[:3].upper()
+            prefix = area[:2]
+            if len(prefix) == 2:
+                candidates.append(self._by_area.get(prefix, set()))
+            else:
+                candidates.append(self._union(
+                    ids for key, ids in self._by_area.items() if key.startswith(prefix)
+                ))
+
+        matches: Optional[Set[str]] = None
+        if candidates:
+            candidates.sort(key=len)
+            matches = set(candidates[0])
+            for ids in candidates[1:]:
+                matches &= ids
+                if not matches:
+                    break
+
+        if search:
+            return sorted(
+                ((-score, self._order[i]), i)
+                for i, score in self._search.search(search, candidates=matches)
+            )
+
+        ids = self._by_id if matches is None else matches
+        return sorted(((self._order[i],), i) for i in ids)
+
+    def _sorted(self, ids: Iterable[str]) -> List[Dict]:
+        return [self._by_id[i] for i in sorted(ids, key=self._order.__getitem__)]
+
+    @staticmethod
+    def _union(id_sets: Iterable[Set[str]]) -> Set[str]:
+        result: Set[str] = set()
+        for ids in id_sets:
+            result |= ids
+        return result
+
+    @staticmethod
+    def _discard(index: Dict[str, Set[str]], key: str, supplier_id: str):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(supplier_id)
+            if not ids:
+                del index[key]
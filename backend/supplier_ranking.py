@@ -0,0 +1,151 @@
+"""
+Distance ranking of suppliers around a point.
+
+Coordinates of available suppliers are kept per type as contiguous float64
+arrays (already in radians, with cos(lat) precomputed), so ranking a query
+is one vectorized Haversine pass plus an argpartition for the top K.
+server.py ranks its in-memory catalog this way; server_base.py's radius
+search runs in MongoDB ($geoNear on the 2dsphere index) instead.
+"""
+from math import radians, cos, sin, asin, sqrt
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Radius of earth in miles
+EARTH_RADIUS_MILES = 3956
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """
+    Calculate distance between two coordinates in miles using Haversine formula
+    """
+    # Convert to radians
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+
+    # Haversine formula
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+
+    return c * EARTH_RADIUS_MILES
+
+
+
+class _TypeArrays:
+    __slots__ = ("ids", "lat", "lon", "cos_lat")
+
+    def __init__(self, ids: List[str], lats: List[float], lons: List[float]):
+        self.ids = np.asarray(ids, dtype=object)
+        self.lat = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lon = np.radians(np.asarray(lons, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat)
+
+    def distances(self, lat: float, lon: float) -> np.ndarray:
+        lat, lon = radians(lat), radians(lon)
+        a = (np.sin((self.lat - lat) * 0.5) ** 2
+             + cos(lat) * self.cos_lat * np.sin((self.lon - lon) * 0.5) ** 2)
+        return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SupplierRanker:
+    """Nearest-supplier ranking over in-memory coordinate arrays"""
+
+    def __init__(self, suppliers: Iterable[Dict] = ()):
+        self._types: Dict[str, _TypeArrays] = {}
+        self.load(suppliers)
+
+    def load(self, suppliers: Iterable[Dict]):
+        """Replace the arrays with the available suppliers given"""
+        columns: Dict[str, Tuple[List[str], List[float], List[float]]] = {}
+        for supplier in suppliers:
+            if not supplier.get("available", True):
+                continue
+            if supplier.get("lat") is None or supplier.get("lon") is None:
+                continue
+            ids, lats, lons = columns.setdefault(supplier["type"], ([], [], []))
+            ids.append(supplier["id"])
+            lats.append(supplier["lat"])
+            lons.append(supplier["lon"])
+        self._types = {t: _TypeArrays(*cols) for t, cols in columns.items()}
+
+    async def load_from(self, collection):
+        """Load the available suppliers from a Motor collection"""
+        cursor = collection.find(
+            {"available": True},
+            {"_id": 0, "id": 1, "type": 1, "lat": 1, "lon": 1}
+        )
+        self.load(await cursor.to_list(None))
+
+    def __len__(self):
+        return sum(len(arrays.ids) for arrays in self._types.values())
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        type: Optional[str] = None,
+        limit: int = 50,
+        radius_miles: Optional[float] = None
+    ) -> List[Tuple[str, float]]:
+        """(supplier id, distance in miles) pairs, nearest first"""
+        return self.rank(lat, lon, type, limit, radius_miles)[0]
+
+    def rank(
+        self,
+        lat: float,
+        lon: float,
+        type: Optional[str] = None,
+        limit: int = 50,
+        radius_miles: Optional[float] = None,
+        after: Optional[Sequence] = None,
+        only: Optional[Collection[str]] = None
+    ) -> Tuple[List[Tuple[str, float]], int]:
+        """
+        (supplier id, distance in miles) pairs in (distance, id) order,
+        starting after the (distance, id) key `after`, and the number of
+        suppliers within the radius. `only` restricts the ranking to those
+        supplier ids.
+        """
+        if type:
+            groups = [self._types[type]] if type in self._types else []
+        else:
+            groups = list(self._types.values())
+        if not groups:
+            return [], 0
+
+        if len(groups) == 1:
+            ids, distances = groups[0].ids, groups[0].distances(lat, lon)
+        else:
+            ids = np.concatenate([g.ids for g in groups])
+            distances = np.concatenate([g.distances(lat, lon) for g in groups])
+
+        keep = None
+        if radius_miles is not None:
+            keep = distances <= radius_miles
+        if only is not None:
+            allowed = np.fromiter((i in only for i in ids), dtype=bool, count=len(ids))
+            keep = allowed if keep is None else keep & allowed
+        if keep is not None:
+            within = np.flatnonzero(keep)
+            ids, distances = ids[within], distances[within]
+        total = len(distances)
+
+        if after is not None:
+            last_distance, last_id = after
+            later = np.flatnonzero(
+                (distances > last_distance) | ((distances == last_distance) & (ids > last_id))
+            )
+            ids, distances = ids[later], distances[later]
+        if limit <= 0 or not len(distances):
+            return [], total
+
+        if len(distances) > limit:
+            kth = distances[np.argpartition(distances, limit - 1)[limit - 1]]
+            # Keep every tie with the Kth so ids decide between them
+            top = np.flatnonzero(distances <= kth)
+        else:
+            top = np.arange(len(distances))
+        ranked = sorted(zip(distances[top].tolist(), ids[top].tolist()))[:limit]
+        return [(supplier_id, distance) for distance, supplier_id in ranked], total
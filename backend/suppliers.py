@@ -0,0 +1,52 @@
+from typing import Dict, Any, Optional
+
+# Conversion between the metres MongoDB uses for spherical queries and the
+# miles the API speaks
+METERS_PER_MILE = 1609.344
+
+
+def miles_to_meters(miles: float) -> float:
+    return miles * METERS_PER_MILE
+
+
+def geojson_point(lat: float, lon: float) -> Dict[str, Any]:
+    """Build a GeoJSON point (note GeoJSON orders coordinates lon, lat)"""
+    return {"type": "Point", "coordinates": [float(lon), float(lat)]}
+
+
+def price_summary(pricing: Optional[Dict[str, float]]) -> Dict[str, Optional[float]]:
+    """
+    Denormalized min/avg/max of a supplier's price list, stored on the
+    document so price sorts can run off an index. None when unpriced.
+    """
+    prices = [float(p) for p in (pricing or {}).values() if p is not None]
+    if not prices:
+        return {"min_price": None, "avg_price": None, "max_price": None}
+    return {
+        "min_price": min(prices),
+        "avg_price": round(sum(prices) / len(prices), 2),
+        "max_price": max(prices),
+    }
+
+
+# Update pipeline stage that recomputes the price summary from `pricing`
+# server-side; append it to any update that changes a supplier's pricing
+_PRICES = {"$map": {
+    "input": {"$objectToArray": {"$ifNull": ["$pricing", {}]}},
+    "in": "$$this.v"
+}}
+PRICE_SUMMARY_STAGE = {"$set": {
+    "min_price": {"$min": _PRICES},
+    "avg_price": {"$round": [{"$avg": _PRICES}, 2]},
+    "max_price": {"$max": _PRICES},
+}}
+
+
+def prepare_supplier(supplier: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fill in the derived fields a supplier document needs before it is written
+    """
+    if supplier.get("lat") is not None and supplier.get("lon") is not None:
+        supplier["location"] = geojson_point(supplier["lat"], supplier["lon"])
+    supplier.update(price_summary(supplier.get("pricing")))
+    return supplier
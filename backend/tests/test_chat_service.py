@@ -0,0 +1,128 @@
+import asyncio
+
+import chat_service
+from chat_cache import ResponseCache
+from chat_service import ChatService
+from llm import ModelConfig
+from llm_scheduler import FairScheduler, Overloaded
+
+
+class CountingProvider:
+    """Streams a fixed reply slowly enough for concurrent callers to overlap"""
+
+    def __init__(self, words=("Register", "the", "death", "within", "five", "days.")):
+        self.words = words
+        self.streams = 0
+        self.completions = 0
+
+    async def complete(self, model, system_message, messages, session_id):
+        self.completions += 1
+        await asyncio.sleep(0.05)
+        return " ".join(self.words)
+
+    async def stream(self, model, system_message, messages, session_id):
+        self.streams += 1
+        for i, word in enumerate(self.words):
+            await asyncio.sleep(0.01)
+            yield (" " if i else "") + word
+
+
+def make_service(monkeypatch, provider):
+    monkeypatch.setattr(chat_service, "get_provider", lambda: provider)
+    model = ModelConfig(provider="fake", name="test-model", timeout=5.0)
+    return ChatService(model, ResponseCache(), scheduler=FairScheduler(max_concurrent=8))
+
+
+async def collect(service, key, session_id):
+    messages = [{"role": "user", "content": "How long do I have to register a death?"}]
+    return "".join([piece async for piece in service.stream(key, "system", messages, session_id)])
+
+
+def test_concurrent_identical_streams_share_one_upstream_call(monkeypatch):
+    provider = CountingProvider()
+    service = make_service(monkeypatch, provider)
+
+    async def run():
+        return await asyncio.gather(*(collect(service, "key", f"session-{i}") for i in range(5)))
+
+    replies = asyncio.run(run())
+
+    assert provider.streams == 1
+    assert service.scheduler.stats()["admitted"] == 1
+    assert replies == ["Register the death within five days."] * 5
+
+
+def test_late_stream_replays_pieces_already_sent(monkeypatch):
+    provider = CountingProvider()
+    service = make_service(monkeypatch, provider)
+
+    async def run():
+        first = asyncio.ensure_future(collect(service, "key", "early"))
+        await asyncio.sleep(0.035)
+        late = await collect(service, "key", "late")
+        return await first, late
+
+    first, late = asyncio.run(run())
+
+    assert provider.streams == 1
+    assert first == late == "Register the death within five days."
+
+
+def test_streams_without_a_key_are_not_shared(monkeypatch):
+    provider = CountingProvider()
+    service = make_service(monkeypatch, provider)
+
+    async def run():
+        await asyncio.gather(*(collect(service, None, f"session-{i}") for i in range(3)))
+
+    asyncio.run(run())
+
+    assert provider.streams == 3
+
+
+def test_joiners_retry_when_the_leaders_session_is_turned_away(monkeypatch):
+    provider = CountingProvider()
+    service = make_service(monkeypatch, provider)
+    service.scheduler = FairScheduler(max_concurrent=2, max_per_session=1, max_queued_per_session=0)
+    messages = [{"role": "user", "content": "How long do I have to register a death?"}]
+
+    async def run():
+        # "busy" already holds its only slot, so its next call is rejected
+        await service.scheduler.acquire("busy")
+        return await asyncio.gather(
+            service.complete("key", "system", messages, "busy"),
+            service.complete("key", "system", messages, "other"),
+            return_exceptions=True
+        )
+
+    leader, joiner = asyncio.run(run())
+
+    assert isinstance(leader, Overloaded)
+    assert joiner == "Register the death within five days."
+    assert provider.completions == 1
+
+
+def test_half_open_probe_is_claimed_only_once_a_slot_is_free(monkeypatch):
+    provider = CountingProvider()
+    service = make_service(monkeypatch, provider)
+    service.scheduler = FairScheduler(max_concurrent=1)
+    breaker = service.guard.breaker
+    breaker._transition(breaker.OPEN)
+    breaker._opened_at -= breaker.reset_seconds
+
+    async def run():
+        await service.scheduler.acquire("busy")
+        call = asyncio.ensure_future(
+            service.complete(None, "system", [{"role": "user", "content": "hi"}], "s1")
+        )
+        await asyncio.sleep(0.01)
+        # Still queued, so another caller with a slot could probe
+        probing = breaker._probing
+        service.scheduler.release("busy")
+        return probing, await call
+
+    probing, reply = asyncio.run(run())
+
+    assert not probing
+    assert reply == "Register the death within five days."
+    assert breaker.state == breaker.CLOSED
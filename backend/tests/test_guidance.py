@@ -0,0 +1,46 @@
+import pytest
+
+from guidance import quick_answer
+
+
+@pytest.mark.parametrize("message", [
+    "How long do I have to register a death?",
+    "How many days to register a death in Scotland?",
+    "What is the deadline for registering a death?",
+    "Is there a time limit to register the death?",
+])
+def test_registration_deadline_questions_are_answered(message):
+    answer = quick_answer(message, "england-wales")
+    assert answer is not None
+    assert "registered within" in answer
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Is Tell Us Once available in Scotland?", "Tell Us Once is available in Scotland"),
+    ("Can I use Tell Us Once?", "Tell Us Once is available in England and Wales"),
+    ("How much does an estate need to be worth for probate?", "£5,000"),
+    ("What is the probate threshold in Scotland?", "Confirmation"),
+    ("What's the DWP bereavement number?", "0800 731 0469"),
+    ("HMRC helpline?", "0300 200 3300"),
+])
+def test_factual_questions_are_answered(message, expected):
+    answer = quick_answer(message, "england-wales")
+    assert answer is not None
+    assert expected in answer
+
+
+@pytest.mark.parametrize("message", [
+    "I registered the death 3 days ago, what now?",
+    "My mum died 2 days ago and I need to register it, where do I go?",
+    "who do I need to register with within the council?",
+    "We registered within a week, is that a problem?",
+    "my dad is registered with a GP, how long until the funeral can happen?",
+    "I need a confirmation letter for the bank",
+    "I need help filling in the probate forms",
+    "Who do I need to tell about probate?",
+    "I used Tell Us Once but the pension payments still arrived, what now?",
+    "Registered the death and used Tell Us Once",
+    "The DWP phone number I was given doesn't work",
+])
+def test_statements_and_other_questions_go_to_the_llm(message):
+    assert quick_answer(message, "england-wales") is None
@@ -0,0 +1,57 @@
+import asyncio
+
+from llm_resilience import LLMGuard
+from llm_scheduler import FairScheduler
+
+
+class SlowProvider:
+    """Answers after `delay` seconds, counting calls"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = 0
+
+    async def complete(self, model, system_message, messages, session_id):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return "reply"
+
+
+def hedging_guard():
+    guard = LLMGuard("test-model", deadline_seconds=5, hedge_quantile=0.5,
+                     hedge_min_seconds=0.01, hedge_budget=1.0, min_samples=1)
+    guard._latencies.append(0.01)
+    return guard
+
+
+def test_hedge_holds_a_slot_of_its_own():
+    guard, provider = hedging_guard(), SlowProvider()
+    scheduler = FairScheduler(max_concurrent=2)
+
+    async def run():
+        async with scheduler.slot("s1"):
+            call = asyncio.ensure_future(guard.complete(provider, "m", "system", [], "s1", slots=scheduler))
+            await asyncio.sleep(0.03)
+            in_flight = scheduler.stats()["in_flight"]
+            await call
+        await asyncio.sleep(0)
+        return in_flight
+
+    in_flight = asyncio.run(run())
+
+    assert provider.calls == 2
+    assert in_flight == 2
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_no_hedge_when_the_scheduler_is_saturated():
+    guard, provider = hedging_guard(), SlowProvider()
+    scheduler = FairScheduler(max_concurrent=1)
+
+    async def run():
+        async with scheduler.slot("s1"):
+            return await guard.complete(provider, "m", "system", [], "s1", slots=scheduler)
+
+    assert asyncio.run(run()) == "reply"
+    assert provider.calls == 1
+    assert guard.stats()["hedging"]["skipped"] == 1
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from llm_scheduler import FairScheduler, Overloaded
+
+
+def test_one_session_cannot_fill_the_shared_queue():
+    scheduler = FairScheduler(max_concurrent=1, max_per_session=1, max_queue=8,
+                              max_queued_per_session=2, max_wait_seconds=60)
+
+    async def run():
+        await scheduler.acquire("busy")
+        waiters = [asyncio.ensure_future(scheduler.acquire("busy")) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(Overloaded) as rejected:
+            await scheduler.acquire("busy")
+        assert rejected.value.reason == "session_queue_full"
+
+        # Other sessions still get a place in the queue
+        other = asyncio.ensure_future(scheduler.acquire("other"))
+        await asyncio.sleep(0)
+        assert not other.done()
+
+        scheduler.release("busy")
+        await asyncio.sleep(0.01)
+        # Round-robin: the other session is served before busy's second waiter
+        assert sum(w.done() for w in waiters) == 1
+        scheduler.release("busy")
+        await asyncio.sleep(0.01)
+        assert other.done()
+
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+
+    asyncio.run(run())
+
+    assert scheduler.rejected["session_queue_full"] == 1
+    assert scheduler.rejected["queue_full"] == 0
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from write_behind import WriteBehindBuffer
+
+
+class SlowCollection:
+    """insert_many blocks until released, like a slow MongoDB write"""
+    name = "chat_messages"
+
+    def __init__(self):
+        self.docs = []
+        self.inserting = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def insert_many(self, docs, ordered=True):
+        self.inserting.set()
+        await self.release.wait()
+        self.docs.extend(docs)
+
+
+def test_sync_waits_for_a_flush_already_under_way():
+    async def run():
+        collection = SlowCollection()
+        buffer = WriteBehindBuffer(collection, max_batch=1, flush_interval=60, key_field="session_id")
+        buffer.start()
+
+        await buffer.add([{"session_id": "s1", "content": "hello"}])
+        # The flusher has taken the batch and its insert is still running
+        await asyncio.wait_for(collection.inserting.wait(), 1)
+
+        sync = asyncio.ensure_future(buffer.sync("s1"))
+        await asyncio.sleep(0.01)
+        assert not sync.done()
+
+        collection.release.set()
+        await asyncio.wait_for(sync, 1)
+        visible = [doc for doc in collection.docs if doc["session_id"] == "s1"]
+        await buffer.stop()
+        return visible, buffer
+
+    visible, buffer = asyncio.run(run())
+
+    assert len(visible) == 1
+    assert buffer.stats()["pending"] == 0
+
+
+def test_sync_returns_at_once_for_other_keys():
+    async def run():
+        collection = SlowCollection()
+        buffer = WriteBehindBuffer(collection, max_batch=1, flush_interval=60, key_field="session_id")
+        buffer.start()
+
+        await buffer.add([{"session_id": "s1", "content": "hello"}])
+        await asyncio.wait_for(collection.inserting.wait(), 1)
+
+        await asyncio.wait_for(buffer.sync("s2"), 0.1)
+        collection.release.set()
+        await buffer.stop()
+
+    asyncio.run(run())
+
+
+class FlakyCollection:
+    """insert_many fails the first `failures` times, then writes"""
+    name = "chat_messages"
+
+    def __init__(self, failures):
+        self.docs = []
+        self.failures = failures
+
+    async def insert_many(self, docs, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        self.docs.extend(docs)
+
+
+def test_durable_add_waits_through_a_failed_flush():
+    async def run():
+        collection = FlakyCollection(failures=1)
+        buffer = WriteBehindBuffer(collection, flush_interval=0.01)
+        buffer.start()
+
+        await asyncio.wait_for(buffer.add([{"content": "hello"}], durable=True), 1)
+        await buffer.stop()
+        return collection, buffer
+
+    collection, buffer = asyncio.run(run())
+
+    assert buffer.failures == 1
+    assert collection.docs == [{"content": "hello"}]
+
+
+def test_durable_add_fails_when_its_documents_are_dropped():
+    async def run():
+        collection = SlowCollection()
+        failed = FlakyCollection(failures=1)
+
+        async def insert_many(docs, ordered=True):
+            # The first insert stalls and then fails
+            if failed.failures:
+                collection.inserting.set()
+                await collection.release.wait()
+            await failed.insert_many(docs, ordered)
+
+        collection.insert_many = insert_many
+        buffer = WriteBehindBuffer(collection, flush_interval=60, max_pending=1)
+        buffer.start()
+
+        add = asyncio.ensure_future(buffer.add([{"content": "hello"}], durable=True))
+        await asyncio.wait_for(collection.inserting.wait(), 1)
+        # The buffer fills up while the insert is failing
+        later = asyncio.ensure_future(buffer.add([{"content": "later"}]))
+        await asyncio.sleep(0.01)
+        collection.release.set()
+
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(add, 1)
+        await asyncio.wait_for(later, 1)
+        await buffer.stop()
+        return failed, buffer
+
+    failed, buffer = asyncio.run(run())
+
+    assert buffer.dropped == 1
+    assert failed.docs == [{"content": "later"}]
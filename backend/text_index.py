@@ -0,0 +1,187 @@
+"""
+Small in-process full-text index.
+
+Documents are tokenized, lightly stemmed and stored in per-term posting
+lists with field-weighted term frequencies. Queries match every term
+(each query term also matches indexed terms it is a prefix of) and rank
+results with BM25; in "any" mode a document need only match one term,
+for ranking passages against free-text questions. Documents can be added
+and removed at any time.
+"""
+import heapq
+import math
+import re
+from bisect import bisect_left, insort
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Shortest query term that is expanded to the indexed terms it prefixes
+MIN_PREFIX_LENGTH = 3
+# Upper bound on prefix expansions per query term
+MAX_PREFIX_TERMS = 50
+
+
+def stem(token: str) -> str:
+    """Strip common English plural and verb endings"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith("ies") and len(token) > 4:
+        return token[:-3] + "y"
+    if token.endswith("sses"):
+        return token[:-2]
+    if token.endswith(("ss", "us", "is")):
+        return token
+    if token.endswith("s"):
+        return token[:-1]
+    if token.endswith("ing") and len(token) > 6:
+        return token[:-3]
+    if token.endswith("ed") and len(token) > 5:
+        return token[:-2]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_RE.findall(text.lower())]
+
+
+class InvertedIndex:
+    """BM25-ranked inverted index over weighted document fields"""
+
+    def __init__(self, fields: Dict[str, float], k1: float = 1.2, b: float = 0.75):
+        self.fields = fields
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, float]] = {}
+        self._terms: List[str] = []  # sorted vocabulary for prefix lookups
+        self._doc_terms: Dict[Hashable, Tuple[str, ...]] = {}
+        self._doc_len: Dict[Hashable, float] = {}
+        self._total_len = 0.0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_len
+
+    def add(self, doc_id: Hashable, doc: Dict[str, Any]):
+        """Index a document, replacing any previous version with the same id"""
+        if doc_id in self._doc_len:
+            self.remove(doc_id)
+
+        frequencies: Dict[str, float] = {}
+        length = 0.0
+        for field, weight in self.fields.items():
+            value = doc.get(field)
+            if not value:
+                continue
+            texts = [value] if isinstance(value, str) else value
+            for text in texts:
+                for term in tokenize(text):
+                    frequencies[term] = frequencies.get(term, 0.0) + weight
+                    length += weight
+
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._terms, term)
+            postings[doc_id] = frequency
+
+        self._doc_terms[doc_id] = tuple(frequencies)
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def remove(self, doc_id: Hashable):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def expand(self, term: str) -> List[str]:
+        """Indexed terms a query term matches: itself plus terms it prefixes"""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [term] if term in self._postings else []
+        matches = []
+        i = bisect_left(self._terms, term)
+        while i < len(self._terms) and self._terms[i].startswith(term):
+            matches.append(self._terms[i])
+            if len(matches) >= MAX_PREFIX_TERMS:
+                break
+            i += 1
+        return matches
+
+    def search(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        candidates: Optional[Set[Hashable]] = None,
+        match_all: bool = True
+    ) -> List[Tuple[Hashable, float]]:
+        """
+        (doc id, score) pairs for documents matching every query term (or
+        any, without match_all), best first, optionally restricted to a
+        candidate set
+        """
+        query_terms = list(dict.fromkeys(TOKEN_RE.findall(query.lower())))
+        if not query_terms or not self._doc_len:
+            return []
+
+        n = len(self._doc_len)
+        avg_len = self._total_len / n or 1.0
+        doc_len = self._doc_len
+        k1_plus_1 = self.k1 + 1
+        norm_base = self.k1 * (1 - self.b)
+        norm_per_len = self.k1 * self.b / avg_len
+        scores: Optional[Dict[Hashable, float]] = None
+
+        # Rarest query terms first so the running intersection stays small
+        expansions = []
+        for raw in query_terms:
+            terms = self.expand(stem(raw))
+            if terms:
+                expansions.append(terms)
+            elif match_all:
+                return []
+        if not expansions:
+            return []
+        expansions.sort(key=lambda terms: sum(len(self._postings[t]) for t in terms))
+
+        for terms in expansions:
+            term_scores: Dict[Hashable, float] = {}
+            for term in terms:
+                postings = self._postings[term]
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                # Walk whichever side of the intersection is smaller
+                allowed = scores if scores is not None and match_all else candidates
+                if allowed is not None and len(allowed) < len(postings):
+                    pairs = ((d, postings[d]) for d in allowed if d in postings)
+                else:
+                    pairs = postings.items()
+                for doc_id, tf in pairs:
+                    if match_all and scores is not None and doc_id not in scores:
+                        continue
+                    if candidates is not None and doc_id not in candidates:
+                        continue
+                    score = idf * tf * k1_plus_1 / (tf + norm_base + norm_per_len * doc_len[doc_id])
+                    if score > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = score
+            if scores is None:
+                scores = term_scores
+            elif match_all:
+                scores = {doc_id: scores[doc_id] + s for doc_id, s in term_scores.items()}
+            else:
+                for doc_id, s in term_scores.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + s
+            if not scores and match_all:
+                return []
+
+        if limit is not None:
+            return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,196 @@
+"""
+Write-behind buffering for append-only collections.
+
+Documents added to a WriteBehindBuffer are written in the background with
+unordered insert_many, once max_batch documents are waiting or every
+flush_interval seconds. A durable add waits until its documents are
+written; concurrent durable adds still share one insert_many (a group
+commit). Failed batches are kept and retried, and durable adds keep
+waiting through the retries, so a caller only sees an error if its
+documents are dropped. Everything pending is written when the buffer is
+stopped.
+"""
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        collection,
+        max_batch: int = 200,
+        flush_interval: float = 0.25,
+        max_pending: int = 10000,
+        key_field: Optional[str] = None
+    ):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # Field whose values sync() can wait on, e.g. "session_id"
+        self.key_field = key_field
+
+        self._docs: List[Dict[str, Any]] = []
+        # Durable adds still waiting, each with its documents
+        self._waiters: List[Tuple[asyncio.Future, List[Dict[str, Any]]]] = []
+        self._pending_keys: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything still pending and stop the background flusher"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        if self._docs:
+            logger.error(f"Write-behind buffer stopped with {len(self._docs)} documents unwritten")
+        waiters, self._waiters = self._waiters, []
+        for waiter, _ in waiters:
+            if not waiter.done():
+                waiter.set_exception(RuntimeError("Stopped before the documents were written"))
+
+    async def add(self, docs: List[Dict[str, Any]], durable: bool = False):
+        """Queue documents; with durable, return once they are written"""
+        if self._task is None:
+            # Not running (scripts, startup): write straight through
+            await self.collection.insert_many(docs, ordered=False)
+            return
+
+        self._docs.extend(docs)
+        if self.key_field:
+            self._pending_keys.update(doc.get(self.key_field) for doc in docs)
+
+        if durable:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append((waiter, docs))
+            self._wakeup.set()
+            await waiter
+        elif len(self._docs) >= self.max_pending:
+            # The flusher is falling behind: make this caller wait for it
+            await self.flush()
+        elif len(self._docs) >= self.max_batch:
+            self._wakeup.set()
+
+    async def sync(self, key: Any):
+        """Write pending documents first if any have `key`, so a read that
+        follows sees them. Documents count as pending until their insert
+        has finished, so this also waits for a flush already under way."""
+        if self._pending_keys.get(key):
+            await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            return
+        async with self._lock:
+            if not self._docs:
+                return
+            batch, self._docs = self._docs, []
+            waiters, self._waiters = self._waiters, []
+
+            try:
+                for i in range(0, len(batch), self.max_batch):
+                    await self._insert(batch[i:i + self.max_batch])
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Write-behind flush to {self.collection.name} failed: {str(e)}")
+                self._requeue(batch, waiters, e)
+                return
+
+            self.written += len(batch)
+            self._settle(batch)
+            for waiter, _ in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def _insert(self, docs: List[Dict[str, Any]]):
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # insert_many assigns _id in place, so a retried batch reports
+            # the documents that made it last time as duplicates
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+        self.batches += 1
+
+    def _requeue(
+        self,
+        batch: List[Dict[str, Any]],
+        waiters: List[Tuple[asyncio.Future, List[Dict[str, Any]]]],
+        error: Exception
+    ):
+        """Put a failed batch back for the next flush. Its durable waiters
+        keep waiting, unless the buffer is too full to keep their documents."""
+        room = max(self.max_pending - len(self._docs), 0)
+        dropped = set()
+        if room < len(batch):
+            self.dropped += len(batch) - room
+            logger.error(f"Write-behind buffer full, dropped {len(batch) - room} documents")
+            dropped = {id(doc) for doc in batch[:len(batch) - room]}
+            self._settle(batch[:len(batch) - room])
+            batch = batch[len(batch) - room:]
+        self._docs[:0] = batch
+
+        kept = []
+        for waiter, docs in waiters:
+            if waiter.done():
+                continue
+            if any(id(doc) in dropped for doc in docs):
+                waiter.set_exception(error)
+            else:
+                kept.append((waiter, docs))
+        self._waiters[:0] = kept
+
+    def _settle(self, docs: List[Dict[str, Any]]):
+        """Stop counting documents that were written or dropped as pending"""
+        if not self.key_field:
+            return
+        for doc in docs:
+            key = doc.get(self.key_field)
+            self._pending_keys[key] -= 1
+            if self._pending_keys[key] <= 0:
+                del self._pending_keys[key]
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._docs),
+            "written": self.written,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }